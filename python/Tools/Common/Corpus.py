@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Packs all of the verse texts in resources/text (and the Hebrews material)
+    into one binary corpus file, so any tool can look up "1 Timothy 3:16"
+    without reading and scanning a chapter file.
+
+    The corpus file is read through mmap, and every lookup is a few fixed
+    width table reads followed by a slice of the text blob, so there is no
+    parsing done per process.
+
+File layout (all integers little-endian, unsigned 32 bit unless noted):
+    header   : magic, version, number of chapters, number of verse slots,
+               text blob size
+    books    : one entry per book number (0-66):
+               first chapter entry, first chapter (u16), chapter count (u16)
+    chapters : first verse slot, number of verse slots
+    offsets  : start of each verse slot in the text blob, plus a sentinel
+    text     : every verse, utf-8, back to back
+    Verses missing from the text (i.e. Matthew 17:21) are empty slots.
+"""
+# Imports ====================================================================
+import argparse
+import mmap
+import os
+import re
+import struct
+
+# Constants ==================================================================
+absolute_path = os.path.dirname(__file__)
+
+resources_path = os.path.join(absolute_path, "../../../resources/")
+text_path = os.path.join(resources_path, "text")
+default_corpus_path = os.path.join(resources_path, "material.corpus")
+
+# Books that are kept as one text file instead of a folder of chapters
+whole_book_paths = {
+    "Hebrews": os.path.join(resources_path, "Hebrews/materials/Hebrews.txt")
+}
+
+# Canonical order, so that a book's index is its book number
+BOOKS = (
+    "", "Genesis", "Exodus", "Leviticus", "Numbers", "Deuteronomy", "Joshua",
+    "Judges", "Ruth", "1 Samuel", "2 Samuel", "1 Kings", "2 Kings",
+    "1 Chronicles", "2 Chronicles", "Ezra", "Nehemiah", "Esther", "Job",
+    "Psalms", "Proverbs", "Ecclesiastes", "Song of Solomon", "Isaiah",
+    "Jeremiah", "Lamentations", "Ezekiel", "Daniel", "Hosea", "Joel", "Amos",
+    "Obadiah", "Jonah", "Micah", "Nahum", "Habakkuk", "Zephaniah", "Haggai",
+    "Zechariah", "Malachi", "Matthew", "Mark", "Luke", "John", "Acts",
+    "Romans", "1 Corinthians", "2 Corinthians", "Galatians", "Ephesians",
+    "Philippians", "Colossians", "1 Thessalonians", "2 Thessalonians",
+    "1 Timothy", "2 Timothy", "Titus", "Philemon", "Hebrews", "James",
+    "1 Peter", "2 Peter", "1 John", "2 John", "3 John", "Jude", "Revelation"
+)
+
+# "1 Thessalonians", "1Thessalonians" and "1thessalonians" all match
+_book_lookup = {name.replace(' ', '').lower(): index
+                for index, name in enumerate(BOOKS) if name}
+
+MAGIC = b"CQCORPUS"
+VERSION = 1
+_header = struct.Struct("<8sIIII")
+_book_entry = struct.Struct("<IHH")
+_chapter_entry = struct.Struct("<II")
+_offset = struct.Struct("<I")
+
+# A verse number is a run of digits standing on its own
+_verse_marker = re.compile(r"(?<!\S)(\d+)(?=\s|$)")
+
+# Same idea of a word as boldr: letters and hyphens, so "God’s" is "god", "s"
+_word = re.compile(r"[a-z]+(?:-[a-z]+)*", flags=re.IGNORECASE)
+
+
+# Function definitions =======================================================
+def book_index(book):
+    """
+    Returns the book number (Matthew is 40) of a book name, ignoring case
+    and spaces. Raises KeyError if the book isn't recognized.
+    """
+    try:
+        return _book_lookup[book.replace(' ', '').lower()]
+    except KeyError:
+        raise KeyError(f"Book {book} not recognized.") from None
+
+
+def verse_id(book, chapter, verse):
+    """
+    Packs a book (name or number), chapter and verse into one integer.
+    Ids sort in canonical order. Chapter and verse each get 8 bits, so
+    raises ValueError if either is outside 1..255.
+    """
+    if isinstance(book, str):
+        book = book_index(book)
+    chapter, verse = int(chapter), int(verse)
+    if not 1 <= chapter <= 0xFF or not 1 <= verse <= 0xFF:
+        raise ValueError(f"{BOOKS[book]} {chapter}:{verse} is not a verse, chapters and verses run from 1 to 255")
+    return (book << 16) | (chapter << 8) | verse
+
+
+def split_verse_id(vid):
+    """
+    Returns (book number, chapter, verse) of a verse id.
+    """
+    return vid >> 16, (vid >> 8) & 0xFF, vid & 0xFF
+
+
+def verse_id_to_string(vid):
+    """
+    Returns a verse id as a reference, i.e. "1 Timothy 3:16"
+    """
+    book, chapter, verse = split_verse_id(vid)
+    return f"{BOOKS[book]} {chapter}:{verse}"
+
+
+def parse_reference(reference):
+    """
+    Turns a single verse reference like "1 Timothy 3:16" into a verse id.
+    """
+    match = re.fullmatch(r"\s*(.+?)\s+(\d+):(\d+)\s*", reference)
+    assert match, f"Invalid reference {reference}"
+    return verse_id(match.group(1), match.group(2), match.group(3))
+
+
+def tokenize(text):
+    """
+    Returns the normalized (lowercase) words of a piece of text, in order.
+    Every material tool should split words with this, so that queries and
+    indexes agree with each other.
+    """
+    return _word.findall(text.lower())
+
+
+def split_verses(text, chapter=None):
+    """
+    Splits the text of a chapter file (or of a whole book) into its verses.
+
+    Chapter files start with the chapter number in place of verse 1, and
+    every following verse starts with its number. Whole book files do the
+    same at every chapter. A number only counts as a marker if it is the next
+    verse (allowing for a single omitted verse) or the next chapter, so
+    numbers in the text itself are left alone.
+
+    Parameters
+    ----------
+    text : the raw text of the file
+    chapter : the chapter number, if the text is a single chapter
+
+    Returns
+    -------
+    A list of (chapter, verse, verse text) tuples, with whitespace collapsed.
+    """
+    markers = verse_markers(text, chapter)
+    verses = []
+    for index, (_, end, chap, verse) in enumerate(markers):
+        stop = markers[index + 1][0] if index + 1 < len(markers) else len(text)
+        verses.append((chap, verse, " ".join(text[end:stop].split())))
+    return verses
+
+
+def verse_markers(text, chapter=None):
+    """
+    Finds the verse numbers of a chapter file (or whole book), see
+    split_verses.
+
+    Returns
+    -------
+    A list of (start, end, chapter, verse) of every verse number, in order
+    """
+    markers = []
+    current_chapter = None
+    current_verse = 0
+    for match in _verse_marker.finditer(text):
+        number = int(match.group(1))
+        if current_chapter is None:
+            if chapter is not None and number != int(chapter):
+                continue
+            current_chapter = number
+            current_verse = 1
+        elif current_verse < number <= current_verse + 2:
+            current_verse = number
+        elif chapter is None and number == current_chapter + 1:
+            current_chapter = number
+            current_verse = 1
+        else:
+            continue
+        markers.append((match.start(), match.end(), current_chapter, current_verse))
+    return markers
+
+
+def read_material(text_dir=text_path, whole_books=None):
+    """
+    Reads every chapter file in text_dir (one folder per book, named
+    like 1Thessalonians/3.chapter) and every whole book file.
+
+    Returns
+    -------
+    A dict of {verse id: verse text}
+    """
+    if whole_books is None:
+        whole_books = whole_book_paths
+    material = {}
+    for folder in sorted(os.listdir(text_dir)):
+        book_path = os.path.join(text_dir, folder)
+        if not os.path.isdir(book_path):
+            continue
+        book = book_index(folder)
+        for filename in os.listdir(book_path):
+            if not filename.endswith(".chapter"):
+                continue
+            chapter = int(filename.split('.')[0])
+            with open(os.path.join(book_path, filename), 'r', encoding="utf8") as file:
+                for chap, verse, text in split_verses(file.read(), chapter):
+                    material[verse_id(book, chap, verse)] = text
+
+    for book, path in whole_books.items():
+        book = book_index(book)
+        with open(path, 'r', encoding="utf8") as file:
+            for chap, verse, text in split_verses(file.read()):
+                material[verse_id(book, chap, verse)] = text
+    return material
+
+
+def source_paths(text_dir=text_path, whole_books=None):
+    """
+    Returns every file that goes into the corpus.
+    """
+    if whole_books is None:
+        whole_books = whole_book_paths
+    paths = list(whole_books.values())
+    for folder in os.listdir(text_dir):
+        book_path = os.path.join(text_dir, folder)
+        if os.path.isdir(book_path):
+            paths.extend(os.path.join(book_path, name) for name in os.listdir(book_path)
+                         if name.endswith(".chapter"))
+    return paths
+
+
+def pack_corpus(material, corpus_path=default_corpus_path):
+    """
+    Writes a {verse id: text} dict to a packed corpus file.
+    """
+    # Group by book, then chapter
+    layout = {}
+    for vid in material:
+        book, chapter, verse = split_verse_id(vid)
+        chapters = layout.setdefault(book, {})
+        chapters[chapter] = max(chapters.get(chapter, 0), verse)
+
+    book_table = [(0, 0, 0)] * len(BOOKS)
+    chapter_table = []
+    offsets = []
+    blob = bytearray()
+    for book in sorted(layout):
+        chapters = layout[book]
+        first, last = min(chapters), max(chapters)
+        book_table[book] = (len(chapter_table), first, last - first + 1)
+        for chapter in range(first, last + 1):
+            num_verses = chapters.get(chapter, 0)
+            chapter_table.append((len(offsets), num_verses))
+            for verse in range(1, num_verses + 1):
+                offsets.append(len(blob))
+                blob += material.get(verse_id(book, chapter, verse), "").encode("utf8")
+    offsets.append(len(blob))
+
+    buffer = bytearray(_header.pack(MAGIC, VERSION, len(chapter_table),
+                                    len(offsets) - 1, len(blob)))
+    for entry in book_table:
+        buffer += _book_entry.pack(*entry)
+    for entry in chapter_table:
+        buffer += _chapter_entry.pack(*entry)
+    buffer += struct.pack(f"<{len(offsets)}I", *offsets)
+    buffer += blob
+
+    # Write beside the destination, then swap it in
+    temp_path = corpus_path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(buffer)
+    os.replace(temp_path, corpus_path)
+
+
+def build_corpus(corpus_path=default_corpus_path, text_dir=text_path, whole_books=None):
+    """
+    Reads the material and packs it into corpus_path.
+    """
+    pack_corpus(read_material(text_dir, whole_books), corpus_path)
+
+
+def is_stale(corpus_path=default_corpus_path, text_dir=text_path, whole_books=None):
+    """
+    True if the corpus file is missing or older than any of its sources.
+    """
+    if not os.path.exists(corpus_path):
+        return True
+    built = os.path.getmtime(corpus_path)
+    return any(os.path.getmtime(path) > built
+               for path in source_paths(text_dir, whole_books))
+
+
+def load_corpus(corpus_path=default_corpus_path, rebuild=True):
+    """
+    Opens the packed corpus, (re)building it first if it is out of date.
+    """
+    if rebuild and is_stale(corpus_path):
+        build_corpus(corpus_path)
+    return PackedCorpus(corpus_path)
+
+
+# Class definitions ==========================================================
+class PackedCorpus:
+    """
+    Read-only view of a packed corpus file. Lookups slice the mmap directly.
+    """
+
+    def __init__(self, corpus_path=default_corpus_path):
+        self.path = corpus_path
+        with open(corpus_path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, version, num_chapters, num_verses, text_size = _header.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{corpus_path} is not a version {VERSION} corpus file")
+        self._books_at = _header.size
+        self._chapters_at = self._books_at + _book_entry.size * len(BOOKS)
+        self._offsets_at = self._chapters_at + _chapter_entry.size * num_chapters
+        self._text_at = self._offsets_at + _offset.size * (num_verses + 1)
+        self.num_chapters = num_chapters
+        self.num_slots = num_verses
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _slot(self, book, chapter, verse):
+        """
+        Returns the verse slot of a reference, or -1 if it isn't in the corpus.
+        """
+        if not 0 < book < len(BOOKS):
+            return -1
+        first_entry, first_chapter, num_chapters = _book_entry.unpack_from(
+            self._map, self._books_at + _book_entry.size * book)
+        chapter_entry = chapter - first_chapter
+        if not 0 <= chapter_entry < num_chapters:
+            return -1
+        first_slot, num_verses = _chapter_entry.unpack_from(
+            self._map, self._chapters_at + _chapter_entry.size * (first_entry + chapter_entry))
+        if not 0 < verse <= num_verses:
+            return -1
+        return first_slot + verse - 1
+
+    def _bounds(self, slot):
+        start, end = struct.unpack_from("<II", self._map, self._offsets_at + _offset.size * slot)
+        return self._text_at + start, self._text_at + end
+
+    def raw(self, vid):
+        """
+        Returns a memoryview of the utf-8 text of a verse, without copying.
+        Raises KeyError if the verse isn't in the corpus.
+        """
+        slot = self._slot(*split_verse_id(vid))
+        if slot >= 0:
+            start, end = self._bounds(slot)
+            if start != end:
+                return self._view[start:end]
+        raise KeyError(verse_id_to_string(vid))
+
+    def text(self, vid):
+        """
+        Returns the text of a verse id as a string.
+        """
+        return str(self.raw(vid), "utf8")
+
+    def lookup(self, reference):
+        """
+        Returns the text of a reference string, i.e. "1 Timothy 3:16"
+        """
+        return self.text(parse_reference(reference))
+
+    def __contains__(self, vid):
+        try:
+            self.raw(vid)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, vid):
+        return self.text(vid)
+
+    def books(self):
+        """
+        Returns the book numbers present in the corpus, in canonical order.
+        """
+        return [book for book in range(1, len(BOOKS))
+                if _book_entry.unpack_from(self._map, self._books_at + _book_entry.size * book)[2]]
+
+    def chapters(self, book):
+        """
+        Returns [(chapter, number of verses)] for a book (name or number).
+        """
+        if isinstance(book, str):
+            book = book_index(book)
+        first_entry, first_chapter, num_chapters = _book_entry.unpack_from(
+            self._map, self._books_at + _book_entry.size * book)
+        chapters = []
+        for entry in range(num_chapters):
+            num_verses = _chapter_entry.unpack_from(
+                self._map, self._chapters_at + _chapter_entry.size * (first_entry + entry))[1]
+            if num_verses:
+                chapters.append((first_chapter + entry, num_verses))
+        return chapters
+
+    def verse_ids(self, book=None):
+        """
+        Yields the id of every verse (of one book, if given) in order.
+        """
+        books = self.books() if book is None else [book_index(book) if isinstance(book, str) else book]
+        for book in books:
+            for chapter, num_verses in self.chapters(book):
+                for verse in range(1, num_verses + 1):
+                    vid = verse_id(book, chapter, verse)
+                    if vid in self:
+                        yield vid
+
+    def items(self, book=None):
+        """
+        Yields (verse id, text) for every verse (of one book, if given).
+        """
+        for vid in self.verse_ids(book):
+            yield vid, self.text(vid)
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="Corpus",
+                                     description="Builds the packed verse corpus, or looks up verses in it.")
+    parser.add_argument("references", nargs='*',
+                        help='References to look up, i.e. "1 Timothy 3:16"')
+    parser.add_argument("--build", action="store_true",
+                        help="Rebuild the corpus file even if it is up to date")
+    parser.add_argument("--corpus", default=default_corpus_path,
+                        help="Location of the corpus file")
+    options = parser.parse_args()
+
+    if options.build:
+        build_corpus(options.corpus)
+        print(f"Corpus written to {options.corpus}")
+
+    with load_corpus(options.corpus) as corpus:
+        for reference in options.references:
+            print(f"{reference}: {corpus.lookup(reference)}")
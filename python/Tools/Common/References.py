@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Turns the reference column of the question and key verse files into
+    verse ids. Understands:
+        1:9            a single verse
+        1:9-12         verses of one chapter
+        1:9-2:3        a range across chapters
+        1:15-16, 2:3   lists, separated by commas or semicolons
+        1:15-16, 18    a bare number after a verse is a verse of that chapter
+        3 or 3-4       whole chapters
+    Ranges that leave a chapter, and whole chapters, are resolved against the
+    chapter lengths in the packed corpus (see Corpus.py).
+
+    The whole reference is matched by one compiled pattern, one item at a
+    time, and parses are kept in an LRU cache, since the same references come
+    up thousands of times across the question and key verse files.
+
+Usage:
+    References.parse("Hebrews", "1:9-2:3")  ->  (verse id, verse id, ...)
+    References.format_reference(vids)       ->  "Hebrews 1:9-2:3"
+"""
+# Imports ====================================================================
+import argparse
+import functools
+import re
+
+import Corpus
+
+# Constants ==================================================================
+CACHE_SIZE = 4096
+
+# One list item: "ch:v", or a bare number, optionally followed by "-" and
+# "ch:v" or a number, then the separator before the next item (or the end)
+_item_pattern = re.compile(r"""
+    \s*(?:(?P<chapter>\d+)\s*:\s*(?P<verse>\d+)|(?P<number>\d+))
+    \s*(?:[-–—]\s*(?:(?P<end_chapter>\d+)\s*:\s*(?P<end_verse>\d+)|(?P<end_number>\d+)))?
+    \s*(?P<separator>[,;]|$)
+    """, re.VERBOSE)
+
+
+# Class definitions ==========================================================
+class Verse:
+    """
+    One verse, held as its integer verse id (see Corpus.py), so
+    verses compare, sort and hash as plain ints, in canonical order.
+    """
+
+    __slots__ = ("vid",)
+
+    def __init__(self, book, chapter, verse):
+        self.vid = Corpus.verse_id(book, chapter, verse)
+
+    @classmethod
+    def from_id(cls, vid):
+        verse = cls.__new__(cls)
+        verse.vid = vid
+        return verse
+
+    @property
+    def book(self):
+        return Corpus.BOOKS[self.vid >> 16]
+
+    @property
+    def chapter(self):
+        return (self.vid >> 8) & 0xFF
+
+    @property
+    def verse(self):
+        return self.vid & 0xFF
+
+    def __eq__(self, other):
+        if not isinstance(other, Verse):
+            # don't attempt to compare against unrelated types
+            return NotImplemented
+
+        return self.vid == other.vid
+
+    def __lt__(self, other):
+        if not isinstance(other, Verse):
+            return NotImplemented
+        return self.vid < other.vid
+
+    def __hash__(self):
+        return self.vid
+
+    def to_string(self):
+        return Corpus.verse_id_to_string(self.vid)
+
+
+class ReferenceParser:
+    """
+    Reference strings -> verse ids, with a cache of cache_size parses.
+
+    corpus is only needed for chapter lengths, and is loaded the first time
+    a reference needs one if it isn't given.
+    """
+
+    def __init__(self, corpus=None, cache_size=CACHE_SIZE):
+        self.corpus = corpus
+        self.lengths = {}
+        self.parse = functools.lru_cache(maxsize=cache_size)(self._parse)
+
+    def chapter_length(self, book, chapter):
+        """
+        Returns the number of verses in a chapter, or 0 if it isn't in the
+        material.
+        """
+        if isinstance(book, str):
+            book = Corpus.book_index(book)
+        if book not in self.lengths:
+            if self.corpus is None:
+                self.corpus = Corpus.load_corpus()
+            self.lengths[book] = dict(self.corpus.chapters(book))
+        return self.lengths[book].get(chapter, 0)
+
+    def _span(self, book, reference, first, last):
+        """
+        Returns the verse ids from (chapter, verse) first to last, inclusive.
+        A verse of None is the start or end of its chapter.
+        """
+        (chapter, verse), (end_chapter, end_verse) = first, last
+        if 0 in (chapter, verse, end_chapter, end_verse):
+            raise ValueError(f"Chapters and verses start at 1 ({book} {reference})")
+        verse = verse or 1
+        if chapter == end_chapter and end_verse is not None:
+            if end_verse < verse:
+                raise ValueError(f"Backwards range in {book} {reference}")
+            length = self.chapter_length(book, chapter)
+            if not length:
+                raise ValueError(f"{book} {chapter} is not in the material ({book} {reference})")
+            if end_verse > length:
+                raise ValueError(f"{book} {chapter} has only {length} verses ({book} {reference})")
+            return [Corpus.verse_id(book, chapter, number) for number in range(verse, end_verse + 1)]
+        if end_chapter < chapter:
+            raise ValueError(f"Backwards range in {book} {reference}")
+
+        vids = []
+        for current in range(chapter, end_chapter + 1):
+            length = self.chapter_length(book, current)
+            if not length:
+                raise ValueError(f"{book} {current} is not in the material ({book} {reference})")
+            start = verse if current == chapter else 1
+            end = end_verse if current == end_chapter and end_verse is not None else length
+            if end > length or start > length:
+                raise ValueError(f"{book} {current} has only {length} verses ({book} {reference})")
+            vids.extend(Corpus.verse_id(book, current, number) for number in range(start, end + 1))
+        return vids
+
+    def _parse(self, book, reference):
+        """
+        Returns a tuple of the verse ids a reference covers, in the order
+        given, without repeats. Raises ValueError if the reference can't be
+        read, and KeyError if the book isn't recognized.
+        """
+        Corpus.book_index(book)
+        text = reference.strip()
+        if not text:
+            raise ValueError(f"Empty reference for {book}")
+
+        vids = []
+        position = 0
+        chapter = None  # chapter a bare number is a verse of
+        while position < len(text):
+            match = _item_pattern.match(text, position)
+            if not match or match.end() == position:
+                raise ValueError(f"Invalid reference {book} {reference}")
+            position = match.end()
+            if match["chapter"]:
+                first = (int(match["chapter"]), int(match["verse"]))
+            elif chapter is not None:
+                first = (chapter, int(match["number"]))
+            else:
+                first = (int(match["number"]), None)
+
+            if match["end_chapter"]:
+                last = (int(match["end_chapter"]), int(match["end_verse"]))
+            elif match["end_number"]:
+                # 1:9-12 ends on a verse, 3-4 on a chapter
+                end = int(match["end_number"])
+                last = (first[0], end) if first[1] is not None else (end, None)
+            else:
+                last = first
+            vids.extend(self._span(book, reference, first, last))
+
+            # "1:15-16, 18" continues chapter 1, a semicolon starts over
+            chapter = last[0] if last[1] is not None and match["separator"] != ';' else None
+            if match["separator"] and position == len(text):
+                raise ValueError(f"Invalid reference {book} {reference}")
+        return tuple(dict.fromkeys(vids))
+
+    def follows(self, previous, vid):
+        """
+        True if vid is the verse right after previous, within its chapter or
+        as the first verse of the next one.
+        """
+        if vid == previous + 1:
+            return True
+        book, chapter, verse = Corpus.split_verse_id(previous)
+        return (chapter < 0xFF and vid == Corpus.verse_id(book, chapter + 1, 1)
+                and verse == self.chapter_length(book, chapter))
+
+    def format(self, vids):
+        """
+        The reverse of parse: verse ids back to one reference, with runs of
+        verses joined into ranges, i.e. "Hebrews 1:9-2:3, 2:5".
+        """
+        vids = sorted(set(vids))
+        if not vids:
+            return ""
+        runs = [[vids[0], vids[0]]]
+        for vid in vids[1:]:
+            if vid >> 16 == runs[-1][1] >> 16 and self.follows(runs[-1][1], vid):
+                runs[-1][1] = vid
+            else:
+                runs.append([vid, vid])
+
+        pieces = []
+        book = None
+        for first, last in runs:
+            first_book, chapter, verse = Corpus.split_verse_id(first)
+            _, end_chapter, end_verse = Corpus.split_verse_id(last)
+            piece = f"{chapter}:{verse}"
+            if end_chapter != chapter:
+                piece += f"-{end_chapter}:{end_verse}"
+            elif end_verse != verse:
+                piece += f"-{end_verse}"
+            if first_book != book:
+                book = first_book
+                piece = f"{Corpus.BOOKS[book]} {piece}"
+            pieces.append(piece)
+        return ", ".join(pieces)
+
+
+# Function definitions =======================================================
+_default_parser = None
+
+
+def default_parser():
+    """
+    Returns the parser shared by parse and format_reference.
+    """
+    global _default_parser
+    if _default_parser is None:
+        _default_parser = ReferenceParser()
+    return _default_parser
+
+
+def parse(book, reference):
+    """
+    Returns the verse ids of a reference, using a shared parser over the
+    default corpus.
+    """
+    return default_parser().parse(book, reference)
+
+
+def format_reference(vids):
+    """
+    Returns verse ids as a reference, i.e. "Hebrews 1:9-2:3, 2:5".
+    """
+    return default_parser().format(vids)
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="References",
+                                     description="Lists the verses a reference covers.")
+    parser.add_argument("book", help="i.e. Hebrews")
+    parser.add_argument("references", nargs='+', help='i.e. "1:9-2:3"')
+    options = parser.parse_args()
+
+    for reference in options.references:
+        vids = parse(options.book, reference)
+        print(f"{options.book} {reference}: " + ", ".join(Corpus.verse_id_to_string(vid) for vid in vids))
+        print(f"    as one reference: {format_reference(vids)}")
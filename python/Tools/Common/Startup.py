@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Makes the tools start faster, and shows where their startup time goes.
+
+    load_config reads a .yml config through a snapshot: the first time (or
+    whenever the file changes) the YAML is parsed, checked and tidied by the
+    tool's validate function, and saved with marshal to
+    resources/config_snapshots. marshal (unlike pickle) can't run code when
+    a file is loaded, so a file dropped in that directory can at most give
+    a wrong config, and validated configs are plain dicts, lists, strings
+    and numbers, which is all it needs to hold.
+    After that, the snapshot is loaded instead, without importing yaml at all
+    (importing yaml is most of the cost of reading a small config). A
+    snapshot is used while the file's modification time and size match it,
+    or, if only the modification time changed (a fresh checkout), while the
+    file's contents still hash the same. It is also only used while the
+    validate function (and the rest of the file it is in) is unchanged, since
+    the snapshot holds what the validate function returned.
+
+    Running a tool through this file reports what its startup cost: every
+    module it imported (with and without the modules that one imported) and
+    every config it loaded.
+
+Usage:
+    python Startup.py ../QuizGen/QuizGen_V2.py --batch --count 3
+    python Startup.py --clear
+"""
+# Imports ====================================================================
+import builtins
+import hashlib
+import marshal
+import os
+import sys
+import time
+
+# Constants ==================================================================
+absolute_path = os.path.dirname(__file__)
+snapshot_path = os.path.join(absolute_path, "../../../resources/config_snapshots")
+
+SNAPSHOT_VERSION = 3
+
+# Every config loaded by this process: (path, "snapshot" or "yaml", seconds)
+config_loads = []
+
+
+# Function definitions =======================================================
+def snapshot_file(path):
+    """
+    Returns where the snapshot of a config is kept, i.e.
+    resources/config_snapshots/quizgen_config-1a2b3c4d.marshal
+    """
+    path = os.path.abspath(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(path.encode("utf8")).hexdigest()[:8]
+    return os.path.join(snapshot_path, f"{name}-{digest}.marshal")
+
+
+def validator_key(validate):
+    """
+    Returns what a snapshot records of the validate function that made it:
+    its name, and a hash of the source file it is in (or of its bytecode,
+    if the source can't be read), so a snapshot is remade when the
+    validation changes.
+    """
+    if validate is None:
+        return None
+    code = getattr(validate, "__code__", None)
+    if code is None:
+        return getattr(validate, "__qualname__", repr(validate))
+    try:
+        with open(code.co_filename, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        digest = hashlib.sha256(code.co_code + repr(code.co_consts).encode("utf8")).hexdigest()
+    return f"{validate.__qualname__}:{digest}"
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'rb') as file:
+            snapshot = marshal.load(file)
+    except (OSError, EOFError, TypeError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def _write_snapshot(path, snapshot):
+    """
+    Writes a snapshot through a temporary file and a rename. A snapshot that
+    can't be written (or a config marshal can't hold, i.e. one with a YAML
+    date in it) only means the next run parses the YAML again.
+    """
+    try:
+        data = marshal.dumps(snapshot)
+    except ValueError:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def load_config(path, validate=None):
+    """
+    Parameters
+    ----------
+    path : a .yml config
+    validate : a function that checks the parsed config (with assert or
+        ValueError) and returns it, tidied up. Only run when the YAML is
+        parsed, so the snapshot holds the validated config.
+
+    Returns
+    -------
+    The config, as yaml.safe_load (and validate) would give it
+    """
+    start = time.perf_counter()
+    stat = os.stat(path)
+    validator = validator_key(validate)
+    snapshot_at = snapshot_file(path)
+    snapshot = _read_snapshot(snapshot_at)
+    if snapshot is not None and snapshot["validator"] == validator:
+        if snapshot["mtime"] == stat.st_mtime_ns and snapshot["size"] == stat.st_size:
+            config_loads.append((path, "snapshot", time.perf_counter() - start))
+            return snapshot["config"]
+    with open(path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if snapshot is not None and snapshot["validator"] == validator and snapshot["sha256"] == digest:
+        snapshot.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+        _write_snapshot(snapshot_at, snapshot)
+        config_loads.append((path, "snapshot", time.perf_counter() - start))
+        return snapshot["config"]
+
+    import yaml
+    config = yaml.safe_load(data.decode("utf8"))
+    if validate is not None:
+        config = validate(config)
+    _write_snapshot(snapshot_at, {"version": SNAPSHOT_VERSION, "validator": validator,
+                                  "mtime": stat.st_mtime_ns, "size": stat.st_size,
+                                  "sha256": digest, "config": config})
+    config_loads.append((path, "yaml", time.perf_counter() - start))
+    return config
+
+
+def clear_snapshots():
+    """
+    Deletes every snapshot, returning how many there were.
+    """
+    if not os.path.isdir(snapshot_path):
+        return 0
+    # .pickle snapshots are from before they were saved with marshal
+    names = [name for name in os.listdir(snapshot_path) if name.endswith((".marshal", ".pickle"))]
+    for name in names:
+        os.remove(os.path.join(snapshot_path, name))
+    return len(names)
+
+
+# Class definitions ==========================================================
+class ImportTimer:
+    """
+    Times every module imported while it's installed, by wrapping
+    builtins.__import__.
+
+    times : {module name: [seconds with the modules it imported,
+                           seconds without them]}
+    """
+
+    def __init__(self):
+        self.times = {}
+        self._children = [0.0]
+        self._import = None
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._children.pop()
+            self._children[-1] += elapsed
+            if name not in self.times:
+                self.times[name] = [elapsed, elapsed - children]
+
+    def report(self, count=20, file=sys.stderr):
+        total = sum(own for _, own in self.times.values())
+        print(f"Imports: {len(self.times)} modules, {total * 1000:.1f}ms", file=file)
+        slowest = sorted(self.times.items(), key=lambda item: item[1][1], reverse=True)[:count]
+        for name, (inclusive, own) in slowest:
+            print(f"    {own * 1000:8.1f}ms {inclusive * 1000:8.1f}ms  {name}", file=file)
+
+
+def report_configs(file=sys.stderr):
+    total = sum(seconds for _, _, seconds in config_loads)
+    print(f"Configs: {len(config_loads)} loaded, {total * 1000:.1f}ms", file=file)
+    for path, source, seconds in config_loads:
+        print(f"    {seconds * 1000:8.1f}ms  {source:8}  {os.path.normpath(path)}", file=file)
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--clear"]:
+        print(f"Deleted {clear_snapshots()} config snapshots.")
+        sys.exit(0)
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print(__doc__)
+        sys.exit(0)
+
+    import atexit
+    import runpy
+
+    script = os.path.abspath(sys.argv[1])
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(script))
+    # The tools import this file as "Startup", so config loads are recorded
+    # in this module rather than in a second copy of it
+    sys.modules.setdefault("Startup", sys.modules[__name__])
+    timer = ImportTimer()
+    started = time.perf_counter()
+
+    def report():
+        timer.uninstall()
+        print(f"\nStartup profile of {os.path.basename(script)} "
+              f"({(time.perf_counter() - started) * 1000:.1f}ms in all)", file=sys.stderr)
+        timer.report()
+        report_configs()
+
+    atexit.register(report)
+    timer.install()
+    runpy.run_path(script, run_name="__main__")
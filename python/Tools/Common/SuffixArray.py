@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Answers "how many times, and where, does this phrase occur?" over the
+    whole material, for question authors checking whether a key phrase is
+    unique. Also lists every n-gram that occurs exactly once.
+
+    Every verse is split into words (see Corpus.tokenize), the words are
+    numbered, and the verses are laid end to end with a separator between
+    them. A suffix array (every position, sorted by the words that follow it)
+    and its LCP array (words shared with the previous suffix) are built once
+    and saved next to the corpus. A phrase of m words is then found with two
+    binary searches, O(m log n), and never matches across two verses.
+
+    Counts are over everything in the corpus. boldr doesn't use this: it
+    counts words and phrases over only the books picked for each run, which
+    it does itself in one pass (see boldr.py hash_phrases).
+
+File layout:
+    header : magic, version, number of words in the vocabulary, number of
+             tokens (all u32)
+    vocab  : the vocabulary, utf-8, newline separated, in id order from 1
+    arrays : tokens, suffix array, LCP array, verse id of each token and
+             position of each token in its verse, each as int32s
+"""
+# Imports ====================================================================
+import argparse
+import os
+import struct
+import sys
+from array import array
+
+import Corpus
+
+# Constants ==================================================================
+default_suffix_path = os.path.join(Corpus.resources_path, "material.sa")
+
+MAGIC = b"CQSUFFIX"
+VERSION = 1
+_header = struct.Struct("<8sIII")
+SEPARATOR = 0  # token id between verses, never part of a match
+
+
+# Function definitions =======================================================
+def build_suffix_array(tokens):
+    """
+    Sorts every suffix of tokens by prefix doubling: suffixes are ranked by
+    their first word, then first 2, 4, 8... words, until every rank is
+    different. O(n log^2 n), but repeated phrases are short, so it only
+    takes a handful of rounds.
+
+    Returns
+    -------
+    sa : list of starting positions, in sorted suffix order
+    """
+    n = len(tokens)
+    if n == 0:
+        return []
+    rank = list(tokens)
+    sa = list(range(n))
+    length = 1
+    while True:
+        keys = [(rank[i], rank[i + length] if i + length < n else -1) for i in range(n)]
+        sa.sort(key=keys.__getitem__)
+        new_rank = [0] * n
+        for index in range(1, n):
+            new_rank[sa[index]] = new_rank[sa[index - 1]] + (keys[sa[index]] != keys[sa[index - 1]])
+        rank = new_rank
+        if rank[sa[-1]] == n - 1:
+            return sa
+        length <<= 1
+
+
+def build_lcp(tokens, sa):
+    """
+    Kasai's algorithm. lcp[i] is the number of words suffix sa[i] shares with
+    suffix sa[i - 1] (lcp[0] is 0). Separators never count as shared, so no
+    shared run crosses from one verse into the next.
+    """
+    n = len(tokens)
+    rank = [0] * n
+    for index, start in enumerate(sa):
+        rank[start] = index
+    lcp = [0] * n
+    shared = 0
+    for start in range(n):
+        if rank[start] == 0:
+            shared = 0
+            continue
+        other = sa[rank[start] - 1]
+        while (start + shared < n and other + shared < n
+               and tokens[start + shared] == tokens[other + shared]
+               and tokens[start + shared] != SEPARATOR):
+            shared += 1
+        lcp[rank[start]] = shared
+        if shared:
+            shared -= 1
+    return lcp
+
+
+def build(verses, suffix_path=default_suffix_path):
+    """
+    Parameters
+    ----------
+    verses : an iterable of (verse id, verse text), in order
+    suffix_path : where to save the arrays
+    """
+    vocab = {}
+    tokens = array('i')
+    token_verse = array('i')
+    token_position = array('i')
+    for vid, text in verses:
+        for position, word in enumerate(Corpus.tokenize(text)):
+            tokens.append(vocab.setdefault(word, len(vocab) + 1))
+            token_verse.append(vid)
+            token_position.append(position)
+        tokens.append(SEPARATOR)
+        token_verse.append(vid)
+        token_position.append(-1)
+
+    sa = array('i', build_suffix_array(tokens))
+    lcp = array('i', build_lcp(tokens, sa))
+
+    words = sorted(vocab, key=vocab.get)
+    temp_path = suffix_path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(_header.pack(MAGIC, VERSION, len(words), len(tokens)))
+        vocab_bytes = "\n".join(words).encode("utf8")
+        file.write(struct.pack("<I", len(vocab_bytes)))
+        file.write(vocab_bytes)
+        for values in (tokens, sa, lcp, token_verse, token_position):
+            if sys.byteorder != "little":
+                values.byteswap()
+            file.write(values.tobytes())
+    os.replace(temp_path, suffix_path)
+
+
+def load_suffix_array(suffix_path=default_suffix_path, rebuild=True):
+    """
+    Opens the saved suffix array, (re)building it first if the corpus is newer.
+    """
+    if rebuild:
+        corpus_stale = Corpus.is_stale()
+        if (corpus_stale or not os.path.exists(suffix_path)
+                or os.path.getmtime(suffix_path) < os.path.getmtime(Corpus.default_corpus_path)):
+            with Corpus.load_corpus() as corpus:
+                build(corpus.items(), suffix_path)
+    return SuffixArray(suffix_path)
+
+
+# Class definitions ==========================================================
+class SuffixArray:
+    """
+    Phrase counts and locations over the material.
+    """
+
+    def __init__(self, suffix_path=default_suffix_path):
+        with open(suffix_path, 'rb') as file:
+            data = file.read()
+        magic, version, num_words, num_tokens = _header.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{suffix_path} is not a version {VERSION} suffix array file")
+        cursor = _header.size
+        vocab_size = struct.unpack_from("<I", data, cursor)[0]
+        cursor += 4
+        words = data[cursor:cursor + vocab_size].decode("utf8").split("\n") if num_words else []
+        cursor += vocab_size
+
+        arrays = []
+        for _ in range(5):
+            values = array('i')
+            values.frombytes(data[cursor:cursor + 4 * num_tokens])
+            if sys.byteorder != "little":
+                values.byteswap()
+            arrays.append(values)
+            cursor += 4 * num_tokens
+        self.tokens, self.sa, self.lcp, self.token_verse, self.token_position = arrays
+        self.words = [""] + words
+        self.vocab = {word: index for index, word in enumerate(words, start=1)}
+
+    def encode(self, phrase):
+        """
+        Returns the phrase as an array of word ids, or None if any of its
+        words aren't in the material.
+        """
+        encoded = array('i')
+        for word in Corpus.tokenize(phrase):
+            if word not in self.vocab:
+                return None
+            encoded.append(self.vocab[word])
+        return encoded
+
+    def _range(self, pattern):
+        """
+        Returns (first, last) such that sa[first:last] are the suffixes
+        starting with pattern.
+        """
+        tokens, sa = self.tokens, self.sa
+        m = len(pattern)
+        low, high = 0, len(sa)
+        while low < high:
+            middle = (low + high) // 2
+            if tokens[sa[middle]:sa[middle] + m] < pattern:
+                low = middle + 1
+            else:
+                high = middle
+        first = low
+        high = len(sa)
+        while low < high:
+            middle = (low + high) // 2
+            if tokens[sa[middle]:sa[middle] + m] <= pattern:
+                low = middle + 1
+            else:
+                high = middle
+        return first, low
+
+    def count(self, phrase):
+        """
+        Returns how many times a phrase occurs in the material.
+        """
+        pattern = self.encode(phrase)
+        if not pattern:
+            return 0
+        first, last = self._range(pattern)
+        return last - first
+
+    def locate(self, phrase):
+        """
+        Returns a sorted list of (verse id, word position) of every
+        occurrence of a phrase.
+        """
+        pattern = self.encode(phrase)
+        if not pattern:
+            return []
+        first, last = self._range(pattern)
+        return sorted((self.token_verse[start], self.token_position[start])
+                      for start in self.sa[first:last])
+
+    def is_unique(self, phrase):
+        """
+        True if a phrase occurs exactly once in the material.
+        """
+        return self.count(phrase) == 1
+
+    def unique_ngrams(self, n):
+        """
+        Yields (verse id, word position, phrase) for every n word phrase that
+        occurs exactly once in the material, in material order.
+
+        A phrase is unique when neither neighbour of its suffix in sorted
+        order shares n words with it.
+        """
+        tokens, sa, lcp = self.tokens, self.sa, self.lcp
+        size = len(sa)
+        found = []
+        for index in range(size):
+            start = sa[index]
+            following = lcp[index + 1] if index + 1 < size else 0
+            if lcp[index] >= n or following >= n:
+                continue
+            gram = tokens[start:start + n]
+            if len(gram) < n or SEPARATOR in gram:
+                continue
+            found.append(start)
+        for start in sorted(found):
+            yield (self.token_verse[start], self.token_position[start],
+                   " ".join(self.words[token] for token in tokens[start:start + n]))
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="SuffixArray",
+                                     description="Counts and locates phrases in the material.")
+    parser.add_argument("phrases", nargs='*',
+                        help='Phrases to look up, i.e. "the word of god"')
+    parser.add_argument("--build", action="store_true",
+                        help="Rebuild the suffix array even if it is up to date")
+    parser.add_argument("--unique", type=int, metavar="N",
+                        help="List every N word phrase that occurs only once")
+    parser.add_argument("--path", default=default_suffix_path,
+                        help="Location of the suffix array file")
+    options = parser.parse_args()
+
+    if options.build:
+        with Corpus.load_corpus() as corpus:
+            build(corpus.items(), options.path)
+        print(f"Suffix array written to {options.path}")
+
+    suffixes = load_suffix_array(options.path)
+    for phrase in options.phrases:
+        places = suffixes.locate(phrase)
+        references = ", ".join(f"{Corpus.verse_id_to_string(vid)} (word {position + 1})"
+                               for vid, position in places)
+        print(f'"{phrase}" occurs {len(places)} times: {references}')
+    if options.unique:
+        for vid, position, phrase in suffixes.unique_ngrams(options.unique):
+            print(f"{Corpus.verse_id_to_string(vid)}: {phrase}")
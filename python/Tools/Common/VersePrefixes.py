@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Finds, for every verse in the chosen material, the fewest opening words
+    that tell it apart from every other verse. FTV questions give "the first
+    five words of a verse", but five words aren't always enough (and are
+    sometimes more than needed), so this flags the verses whose first five
+    words are shared with another verse.
+
+    Verses are sorted by their words (a sorted prefix array), so a verse's
+    shortest unique prefix is one word longer than the longest prefix it
+    shares with either neighbour in the sorted order.
+
+    Words are the verse's whitespace separated words, compared without case
+    or punctuation, so a prefix length can be used directly on the verse text.
+"""
+# Imports ====================================================================
+import argparse
+
+import Corpus
+
+# Constants ==================================================================
+FTV_PROMPT_WORDS = 5
+
+
+# Class definitions ==========================================================
+class VersePrefix:
+    """
+    The opening words of one verse, and how many of them are needed.
+
+    unique_length is None if the whole verse is also the start of another
+    verse, so no prefix of it is unique. collisions are the other verses
+    starting with the same FTV_PROMPT_WORDS words.
+    """
+
+    def __init__(self, vid, words, unique_length, collisions):
+        self.vid = vid
+        self.words = words
+        self.unique_length = unique_length
+        self.collisions = collisions
+
+    def is_ambiguous(self, num_words=FTV_PROMPT_WORDS):
+        """
+        True if the first num_words words don't identify the verse.
+        """
+        return self.unique_length is None or num_words < self.unique_length
+
+    def prompt_length(self, minimum=FTV_PROMPT_WORDS):
+        """
+        Returns how many words an FTV prompt should give: at least minimum,
+        more if that's what it takes to be unique, but always leaving at
+        least one word for the answer.
+        """
+        length = max(minimum, self.unique_length or len(self.words))
+        return max(1, min(length, len(self.words) - 1))
+
+
+# Function definitions =======================================================
+def normalize_words(text):
+    """
+    Returns the whitespace separated words of text, lowercase with
+    punctuation removed. Words that are only punctuation become "".
+    """
+    return tuple("".join(Corpus.tokenize(word)) for word in text.split())
+
+
+def common_length(first, second):
+    """
+    Returns the number of leading words two word tuples share.
+    """
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+def find_prefixes(verses, num_words=FTV_PROMPT_WORDS):
+    """
+    Parameters
+    ----------
+    verses : an iterable of (verse id, verse text)
+    num_words : the FTV prompt length to check for collisions
+
+    Returns
+    -------
+    A dict of {verse id: VersePrefix}
+    """
+    entries = sorted((normalize_words(text), vid) for vid, text in verses)
+    shared = [0] * len(entries)
+    for index in range(1, len(entries)):
+        length = common_length(entries[index - 1][0], entries[index][0])
+        shared[index - 1] = max(shared[index - 1], length)
+        shared[index] = max(shared[index], length)
+
+    # Verses with the same opening words sit next to each other
+    groups = {}
+    for words, vid in entries:
+        groups.setdefault(words[:num_words], []).append(vid)
+
+    prefixes = {}
+    for index, (words, vid) in enumerate(entries):
+        unique_length = shared[index] + 1
+        if unique_length > len(words):
+            unique_length = None
+        collisions = [other for other in groups[words[:num_words]] if other != vid]
+        prefixes[vid] = VersePrefix(vid, words, unique_length, collisions)
+    return prefixes
+
+
+def corpus_prefixes(corpus, books=None, num_words=FTV_PROMPT_WORDS):
+    """
+    find_prefixes over the corpus, limited to a list of books if given.
+    """
+    if books is None:
+        verses = corpus.items()
+    else:
+        verses = [item for book in books for item in corpus.items(book)]
+    return find_prefixes(verses, num_words)
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="VersePrefixes",
+                                     description="Lists verses whose first words don't identify them.")
+    parser.add_argument("--books",
+                        help="Comma-separated books to use as material (default: all of the corpus)")
+    parser.add_argument("--words", type=int, default=FTV_PROMPT_WORDS,
+                        help="Prompt length to check")
+    options = parser.parse_args()
+
+    books = [book.strip() for book in options.books.split(',')] if options.books else None
+    with Corpus.load_corpus() as corpus:
+        prefixes = corpus_prefixes(corpus, books, options.words)
+
+    ambiguous = [prefix for vid, prefix in sorted(prefixes.items()) if prefix.is_ambiguous(options.words)]
+    for prefix in ambiguous:
+        if prefix.unique_length:
+            needed = f"needs {prefix.unique_length} words"
+        else:
+            needed = "has no unique prefix"
+        others = ", ".join(Corpus.verse_id_to_string(other) for other in prefix.collisions)
+        print(f"{Corpus.verse_id_to_string(prefix.vid)} {needed}, "
+              f"first {options.words} shared with {others}")
+    print(f"{len(ambiguous)} of {len(prefixes)} verses are not identified by their first {options.words} words.")
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    An inverted index over the quizzing material, to answer "which verses
+    contain the word X?" without grepping resources/text.
+
+    Every normalized word (see Corpus.tokenize) maps to the sorted verse ids
+    it appears in, along with its word positions in each verse. Words can be
+    combined with AND / OR, and phrases are found by lining up positions.
+
+    The index is saved next to the corpus with delta-encoded postings, and
+    each word's postings are only decoded the first time it is asked for.
+
+File layout:
+    header  : magic, version (u32), number of words (u32)
+    lexicon : for every word, in sorted order:
+              word length (u8), word (utf-8), postings size (u32)
+    postings: for every word, varints of:
+              number of verses, then for each verse:
+              verse id - previous verse id, number of positions,
+              each position - previous position
+"""
+# Imports ====================================================================
+import argparse
+import os
+import re
+import struct
+
+import Corpus
+
+# Constants ==================================================================
+default_index_path = os.path.join(Corpus.resources_path, "material.index")
+
+MAGIC = b"CQINDEX1"
+VERSION = 1
+_header = struct.Struct("<8sII")
+_size = struct.Struct("<I")
+
+
+# Function definitions =======================================================
+def encode_varints(numbers, out):
+    """
+    Appends unsigned integers to the bytearray out, 7 bits per byte.
+    """
+    for number in numbers:
+        while number > 0x7F:
+            out.append((number & 0x7F) | 0x80)
+            number >>= 7
+        out.append(number)
+
+
+def decode_varints(data):
+    """
+    Returns the list of unsigned integers in a run of varint bytes.
+    """
+    numbers = []
+    number = 0
+    shift = 0
+    for byte in data:
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(number)
+            number = 0
+            shift = 0
+    return numbers
+
+
+def build_postings(verses):
+    """
+    Parameters
+    ----------
+    verses : an iterable of (verse id, verse text), in verse id order
+
+    Returns
+    -------
+    A dict of {word: {verse id: [positions]}}
+    """
+    postings = {}
+    for vid, text in verses:
+        for position, word in enumerate(Corpus.tokenize(text)):
+            postings.setdefault(word, {}).setdefault(vid, []).append(position)
+    return postings
+
+
+def write_index(postings, index_path=default_index_path):
+    """
+    Writes the postings from build_postings to a compact index file.
+    """
+    lexicon = bytearray()
+    blob = bytearray()
+    for word in sorted(postings):
+        encoded = bytearray()
+        verses = postings[word]
+        encode_varints((len(verses),), encoded)
+        last_vid = 0
+        for vid in sorted(verses):
+            positions = verses[vid]
+            encode_varints((vid - last_vid, len(positions)), encoded)
+            encode_varints([position - last for position, last in zip(positions, [0] + positions)],
+                           encoded)
+            last_vid = vid
+        word_bytes = word.encode("utf8")
+        lexicon.append(len(word_bytes))
+        lexicon += word_bytes
+        lexicon += _size.pack(len(encoded))
+        blob += encoded
+
+    temp_path = index_path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(_header.pack(MAGIC, VERSION, len(postings)))
+        file.write(lexicon)
+        file.write(blob)
+    os.replace(temp_path, index_path)
+
+
+def build_index(index_path=default_index_path, corpus=None):
+    """
+    Indexes every verse of the corpus and writes it to index_path.
+    """
+    if corpus is None:
+        corpus = Corpus.load_corpus()
+    write_index(build_postings(corpus.items()), index_path)
+
+
+def load_index(index_path=default_index_path, rebuild=True):
+    """
+    Opens the word index, (re)building it first if the corpus is newer.
+    """
+    if rebuild:
+        corpus_stale = Corpus.is_stale()
+        if (corpus_stale or not os.path.exists(index_path)
+                or os.path.getmtime(index_path) < os.path.getmtime(Corpus.default_corpus_path)):
+            with Corpus.load_corpus() as corpus:
+                build_index(index_path, corpus)
+    return WordIndex(index_path)
+
+
+# Class definitions ==========================================================
+class WordIndex:
+    """
+    Word -> verse lookups over the material.
+
+    Query results are sorted lists of verse ids, see
+    Corpus.verse_id_to_string to turn them back into references.
+    """
+
+    def __init__(self, index_path=default_index_path):
+        with open(index_path, 'rb') as file:
+            data = file.read()
+        magic, version, num_words = _header.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{index_path} is not a version {VERSION} index file")
+
+        # Read the lexicon, remembering where each word's postings are
+        lexicon = {}
+        cursor = _header.size
+        spans = []
+        for _ in range(num_words):
+            length = data[cursor]
+            word = data[cursor + 1:cursor + 1 + length].decode("utf8")
+            cursor += 1 + length
+            spans.append((word, _size.unpack_from(data, cursor)[0]))
+            cursor += _size.size
+        for word, size in spans:
+            lexicon[word] = (cursor, cursor + size)
+            cursor += size
+
+        self._data = data
+        self._lexicon = lexicon
+        self._decoded = {}
+
+    def __len__(self):
+        return len(self._lexicon)
+
+    def __contains__(self, word):
+        return word.lower() in self._lexicon
+
+    def words(self):
+        """
+        Returns every word in the index, sorted.
+        """
+        return sorted(self._lexicon)
+
+    def postings(self, word):
+        """
+        Returns {verse id: tuple of positions} for a word (empty if the word
+        isn't in the material). Decoded postings are kept for later queries.
+        """
+        word = word.lower()
+        found = self._decoded.get(word)
+        if found is not None:
+            return found
+        if word not in self._lexicon:
+            return {}
+        start, end = self._lexicon[word]
+        numbers = decode_varints(self._data[start:end])
+        found = {}
+        cursor = 1
+        vid = 0
+        for _ in range(numbers[0]):
+            vid += numbers[cursor]
+            count = numbers[cursor + 1]
+            cursor += 2
+            positions = []
+            position = 0
+            for delta in numbers[cursor:cursor + count]:
+                position += delta
+                positions.append(position)
+            found[vid] = tuple(positions)
+            cursor += count
+        self._decoded[word] = found
+        return found
+
+    def verses(self, word):
+        """
+        Returns the sorted verse ids containing a word.
+        """
+        return list(self.postings(word))
+
+    def count(self, word):
+        """
+        Returns how many times a word appears in the material.
+        """
+        return sum(len(positions) for positions in self.postings(word).values())
+
+    def all_of(self, *words):
+        """
+        Returns the sorted verse ids containing every one of the words.
+        """
+        if not words:
+            return []
+        postings = sorted((self.postings(word) for word in words), key=len)
+        found = set(postings[0])
+        for other in postings[1:]:
+            found.intersection_update(other)
+        return sorted(found)
+
+    def any_of(self, *words):
+        """
+        Returns the sorted verse ids containing at least one of the words.
+        """
+        found = set()
+        for word in words:
+            found.update(self.postings(word))
+        return sorted(found)
+
+    def phrase(self, text):
+        """
+        Returns the sorted verse ids containing the words of text in a row.
+        """
+        words = Corpus.tokenize(text)
+        if not words:
+            return []
+        postings = [self.postings(word) for word in words]
+        found = []
+        for vid in self.all_of(*words):
+            later = [set(posting[vid]) for posting in postings[1:]]
+            for start in postings[0][vid]:
+                if all(start + offset in positions
+                       for offset, positions in enumerate(later, start=1)):
+                    found.append(vid)
+                    break
+        return found
+
+    def search(self, query):
+        """
+        Runs a query string. Quoted text is a phrase, and terms are joined
+        with AND (the default between terms) or OR, evaluated left to right.
+        i.e. 'faith AND love', 'grace OR peace', '"word of god" OR gospel'
+        Terms with no words in them ("&", "1:9") are skipped, rather than
+        matching nothing and emptying an AND.
+        """
+        found = None
+        joiner = "AND"
+        for match in re.finditer(r'"([^"]*)"|(\S+)', query):
+            phrase, term = match.groups()
+            if phrase is None and term in ("AND", "OR"):
+                joiner = term
+                continue
+            words = Corpus.tokenize(term if phrase is None else phrase)
+            if not words:
+                continue
+            verses = self.verses(words[0]) if len(words) == 1 else self.phrase(term or phrase)
+            if found is None:
+                found = set(verses)
+            elif joiner == "OR":
+                found.update(verses)
+            else:
+                found.intersection_update(verses)
+            joiner = "AND"
+        return sorted(found) if found else []
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="WordIndex",
+                                     description="Finds the verses of the material that contain words or phrases.")
+    parser.add_argument("query", nargs='?',
+                        help='i.e. faith AND love, grace OR peace, "word of god"')
+    parser.add_argument("--build", action="store_true",
+                        help="Rebuild the index even if it is up to date")
+    parser.add_argument("--index", default=default_index_path,
+                        help="Location of the index file")
+    options = parser.parse_args()
+
+    if options.build:
+        build_index(options.index)
+        print(f"Index written to {options.index}")
+
+    if options.query:
+        index = load_index(options.index)
+        with Corpus.load_corpus(rebuild=False) as corpus:
+            for vid in index.search(options.query):
+                print(f"{Corpus.verse_id_to_string(vid)}: {corpus.text(vid)}")
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Finds questions that are the same question with trivial wording
+    differences (i.e. "Oppose all makind how?" / "Oppose all mankind how?"),
+    which turn up when libraries are merged, so that a quiz doesn't get both.
+
+    A MinHash signature of each question's words and word pairs is cut into
+    bands, and locality-sensitive hashing puts every band in a bucket, so only
+    questions sharing a bucket are ever compared. Candidates are then checked
+    with the exact Jaccard similarity of their character shingles, which
+    forgives typos. This keeps it well under quadratic for 100k+ questions.
+
+    Only questions of the same type that share a verse are compared, since
+    a QT and an FTV of the same verse have the same words on purpose, and a
+    short question ("Who? / Paul") can be asked of many verses.
+"""
+# Imports ====================================================================
+import argparse
+import os
+import random
+import sys
+import zlib
+
+absolute_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(absolute_path, "../Common"))
+
+import Corpus  # noqa: E402
+import References  # noqa: E402
+
+# Constants ==================================================================
+SHINGLE_SIZE = 4      # characters per shingle, for the final comparison
+NUM_HASHES = 32       # length of a MinHash signature
+BANDS = 8             # LSH bands, each of NUM_HASHES // BANDS hashes
+THRESHOLD = 0.7       # Jaccard similarity to call two questions duplicates
+
+# Each signature hash is its own random (a * x + b) mod p, p the first prime
+# above 2**32, so the hashes of a signature are independent of each other
+_PRIME = (1 << 32) + 15
+_random = random.Random(20231001)
+_permutations = [(_random.randrange(1, _PRIME), _random.randrange(_PRIME)) for _ in range(NUM_HASHES)]
+
+
+# Function definitions =======================================================
+def normalize(text):
+    """
+    Lowercase words only, single spaced.
+    """
+    return " ".join(Corpus.tokenize(text))
+
+
+def shingles(prompt, answer, size=SHINGLE_SIZE):
+    """
+    Returns the set of hashed character shingles of a normalized prompt
+    and answer. Prompt and answer shingles are hashed differently, so a
+    question asked the other way around ("Who send you greetings?" /
+    "Those who come from Italy send you what?") isn't a duplicate.
+    """
+    found = set()
+    for field, text in ((b"q", prompt), (b"a", answer)):
+        encoded = normalize(text).encode("utf8")
+        start = zlib.crc32(field)
+        if len(encoded) <= size:
+            found.add(zlib.crc32(encoded, start))
+        else:
+            found.update(zlib.crc32(encoded[index:index + size], start)
+                         for index in range(len(encoded) - size + 1))
+    return found
+
+
+def word_shingles(prompt, answer):
+    """
+    Returns the hashed words and word pairs of a normalized prompt and
+    answer. These are what the signature is made from: there are few of
+    them, and common letter runs ("the ") don't make unrelated questions
+    look alike.
+    """
+    found = set()
+    for field, text in (("q", prompt), ("a", answer)):
+        words = Corpus.tokenize(text)
+        found.update(zlib.crc32(f"{field} {word}".encode("utf8")) for word in words)
+        found.update(zlib.crc32(f"{field} {first} {second}".encode("utf8"))
+                     for first, second in zip(words, words[1:]))
+    return found
+
+
+def signature(shingle_set):
+    """
+    MinHash signature: for each permutation, the smallest permuted shingle.
+    Two questions agree on a given hash with probability equal to the
+    Jaccard similarity of their shingles.
+    """
+    if not shingle_set:
+        return tuple([0] * NUM_HASHES)
+    values = list(shingle_set)
+    return tuple(min([(a * value + b) % _PRIME for value in values])
+                 for a, b in _permutations)
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def find_duplicates(items, threshold=THRESHOLD, bands=BANDS):
+    """
+    Parameters
+    ----------
+    items : a list of (type, verse ids, prompt, answer) for every question.
+        Only questions with a verse in common can be duplicates. Empty verse
+        ids (a reference that couldn't be read) match any verse.
+    threshold : the Jaccard similarity of shingles to count as a duplicate
+    bands : number of LSH bands. More bands finds less similar pairs, at the
+        cost of more comparisons.
+
+    Returns
+    -------
+    clusters : a list of lists of item indexes, each list being a group of
+        two or more near-duplicates, in item order
+    """
+    rows = NUM_HASHES // bands
+
+    # Bucket every item by each band of its signature
+    buckets = {}
+    for index, (_type, _, prompt, answer) in enumerate(items):
+        hashes = signature(word_shingles(prompt, answer))
+        for band in range(bands):
+            key = (_type, band, hashes[band * rows:(band + 1) * rows])
+            buckets.setdefault(key, []).append(index)
+
+    # Union-find over the confirmed pairs
+    parent = list(range(len(items)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    # Candidates are confirmed on their letter shingles, which forgive typos
+    shingle_sets = {}
+    checked = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        for position, first in enumerate(members):
+            for second in members[position + 1:]:
+                if (first, second) in checked:
+                    continue
+                checked.add((first, second))
+                if find(first) == find(second):
+                    continue
+                first_verses, second_verses = items[first][1], items[second][1]
+                if first_verses and second_verses and first_verses.isdisjoint(second_verses):
+                    continue
+                if first not in shingle_sets:
+                    shingle_sets[first] = shingles(*items[first][2:])
+                if second not in shingle_sets:
+                    shingle_sets[second] = shingles(*items[second][2:])
+                if jaccard(shingle_sets[first], shingle_sets[second]) >= threshold:
+                    parent[find(second)] = find(first)
+
+    clusters = {}
+    for index in range(len(items)):
+        clusters.setdefault(find(index), []).append(index)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def question_items(questions):
+    """
+    Turns Question objects (anything with _type, verse_ids(), prompt and
+    answer) into the items find_duplicates expects.
+    """
+    return [(question._type, frozenset(question.verse_ids()), question.prompt, question.answer)
+            for question in questions]
+
+
+def collapse(questions, threshold=THRESHOLD):
+    """
+    Returns the questions with all but the first of each group of
+    near-duplicates removed, and the list of groups found.
+    """
+    clusters = find_duplicates(question_items(questions), threshold)
+    dropped = {index for members in clusters for index in members[1:]}
+    kept = [question for index, question in enumerate(questions) if index not in dropped]
+    return kept, clusters
+
+
+# Main =======================================================================
+def main():
+    import QuestionValidator
+
+    parser = argparse.ArgumentParser(prog="Dedupe",
+                                     description="Reports groups of near-duplicate questions.")
+    parser.add_argument("files", nargs='*',
+                        help="Question .csv files to check together (defaults to the practice and Hebrews libraries)")
+    parser.add_argument("--book",
+                        help="Book to use for files with no Book column")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Similarity (0-1) needed to call two questions duplicates")
+    options = parser.parse_args()
+
+    if options.files:
+        libraries = [(path, options.book) for path in options.files]
+    else:
+        libraries = QuestionValidator.default_libraries
+
+    rows = []
+    for path, default_book in libraries:
+        for line, book, reference, _type, prompt, answer in QuestionValidator.read_rows(path, default_book):
+            rows.append((os.path.basename(path), line, book, reference, _type, prompt, answer))
+
+    items = []
+    for filename, line, book, reference, _type, prompt, answer in rows:
+        try:
+            vids = frozenset(References.parse(book, reference))
+        except (AssertionError, KeyError, ValueError):
+            vids = frozenset()  # QuestionValidator reports these
+        items.append((_type, vids, prompt, answer))
+    clusters = find_duplicates(items, options.threshold)
+    for members in clusters:
+        print("Near-duplicates:")
+        for index in members:
+            filename, line, book, reference, _type, prompt, answer = rows[index]
+            print(f"    {filename}:{line} {book} {reference} {_type}: {prompt} / {answer}")
+    print(f"{len(clusters)} groups of near-duplicates found in {len(rows)} questions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Writes a whole generated packet (every quiz, the backup questions, and a
+    manifest of the seeds and question ids used) as one file, instead of one
+    .html file per quiz:
+        zip  : one .html per quiz plus manifest.json, in one .zip archive
+        html : one .html page with an index linking to every quiz, and the
+               manifest embedded as json
+    The file is built in memory, written with one buffered stream to a
+    temporary file next to it, and renamed into place, so a packet is either
+    all there or not there at all, and an old packet of the same name is
+    replaced rather than causing an error.
+"""
+# Imports ====================================================================
+import html
+import io
+import json
+import os
+import zipfile
+
+# Constants ==================================================================
+formats = ("files", "zip", "html")
+
+
+# Function definitions =======================================================
+def write_atomic(path, data):
+    """
+    Writes bytes to path through a temporary file and a rename.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def quiz_manifest(title, quiz):
+    """
+    The manifest entry of one quiz: its title, seed (if it has one) and the
+    id, reference and type of every question, in order.
+    """
+    return {
+        "title": title,
+        "seed": getattr(quiz, "seed", None),
+        "questions": [{"id": question.question_id(),
+                       "reference": question.reference(),
+                       "type": question._type}
+                      for question in quiz.question_set],
+    }
+
+
+def packet_manifest(packet_title, seed, entries):
+    """
+    Parameters
+    ----------
+    packet_title : i.e. "Practice Meet Quizzes"
+    seed : the seed the packet was generated from
+    entries : a list of (title, Quiz), backups included
+
+    Returns
+    -------
+    The manifest, as a dict ready for json
+    """
+    return {
+        "title": packet_title,
+        "seed": seed,
+        "quizzes": [quiz_manifest(title, quiz) for title, quiz in entries],
+    }
+
+
+def file_name(title):
+    """
+    Returns a title as a file name, i.e. "Practice Meet Quizzes #1.html"
+    """
+    return "".join(character for character in title if character not in '<>:"/\\|?*') + ".html"
+
+
+def export_zip(path, documents, manifest):
+    """
+    Writes every (title, html) document, and manifest.json, into one .zip.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for title, document in documents:
+            archive.writestr(file_name(title), document)
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    write_atomic(path, buffer.getvalue())
+
+
+def export_html(path, packet_title, sections, manifest, timestamp=""):
+    """
+    Writes every (title, body html) section into one page, after an index
+    that links to each of them.
+    """
+    parts = [f"""<html><head><meta charset="utf-8"><title>{html.escape(packet_title)}</title><style>
+    h1 {{text-align: center;}}
+    h3 {{text-align: right;}}
+    p {{text-align: left;}}
+    div {{text-align: center;}}
+    section {{page-break-before: always;}}
+    </style>
+    </head><body><h1>{html.escape(packet_title)}</h1><h3>{timestamp}</h3>
+    <ol>"""]
+    for number, (title, _) in enumerate(sections, start=1):
+        parts.append(f'<li><a href="#quiz-{number}">{html.escape(title)}</a></li>')
+    parts.append("</ol>")
+    for number, (title, body) in enumerate(sections, start=1):
+        parts.append(f'<section id="quiz-{number}"><h1>{html.escape(title)}</h1>{body}</section>')
+    # "</" can't appear inside a script tag
+    manifest_json = json.dumps(manifest, indent=2).replace("</", "<\\/")
+    parts.append(f'<script type="application/json" id="manifest">\n{manifest_json}\n</script>')
+    parts.append("</body></html>\n")
+    write_atomic(path, "\n".join(parts).encode("utf8"))
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Reads a key verse .csv, whichever way it was written:
+        Memory-Verses.csv : a book, then its key verses, one per cell
+                            (1 Timothy,1:15-17,2:5-6,3:16,...)
+        HebKey.csv        : key verses only, with no book (1:1,1:2,1:3),
+                            for a season of one book
+    A cell can also carry its own book ("Hebrews 1:1-2"). Ranges and lists
+    are expanded (see Common/References.py), verses listed twice are kept
+    once, and the result is a KeyVerseSet: the verse ids in order, and a
+    set of them for "is this a key verse?" checks.
+
+Usage:
+    python KeyVerses.py ../../../resources/verses/2023-24-Memory-Verses.csv
+    python KeyVerses.py ../../../resources/Hebrews/questions/HebKey.csv --book Hebrews
+"""
+# Imports ====================================================================
+import argparse
+import bisect
+import csv
+import os
+import re
+import sys
+from array import array
+
+absolute_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(absolute_path, "../Common"))
+
+import Corpus  # noqa: E402
+import References  # noqa: E402
+from References import Verse  # noqa: E402
+
+# Constants ==================================================================
+# "Hebrews 1:1-2", a reference with its book in front
+_cell_pattern = re.compile(r"\s*(.*?[A-Za-z].*?)\s+(\d[\d:,;\s\-–—]*?)\s*")
+
+
+# Function definitions =======================================================
+def book_of(cell):
+    """
+    Returns the book name of a cell that is only a book, i.e. "1 Timothy",
+    otherwise None.
+    """
+    try:
+        return Corpus.BOOKS[Corpus.book_index(cell)]
+    except KeyError:
+        return None
+
+
+def cell_verse_ids(cell, book):
+    """
+    Returns the verse ids of one cell, a reference in book or one with its
+    own book in front.
+    """
+    match = _cell_pattern.fullmatch(cell)
+    if match and book_of(match.group(1)):
+        return References.parse(book_of(match.group(1)), match.group(2))
+    assert book, f"{cell.strip()} has no book, a default book is needed"
+    return References.parse(book, cell)
+
+
+def read_key_verses(path, default_book=None):
+    """
+    Parameters
+    ----------
+    path : a key verse .csv, see the top of this file
+    default_book : the book of rows (or cells) that don't name one
+
+    Returns
+    -------
+    A KeyVerseSet of every verse in the file
+    """
+    vids = []
+    with open(path, mode='r', encoding='utf-8-sig', newline='') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        for line, row in enumerate(csv_reader, start=1):
+            cells = [cell for cell in row if cell.strip()]
+            if not cells:
+                continue
+            book = book_of(cells[0])
+            if book is not None:
+                cells = cells[1:]
+            elif line == 1 and cells[0].strip().lower() == "book":
+                continue  # a header
+            try:
+                for cell in cells:
+                    vids.extend(cell_verse_ids(cell, book or default_book))
+            except (AssertionError, KeyError, ValueError) as error:
+                raise ValueError(f"{path} line {line}: {error}") from None
+    return KeyVerseSet(vids)
+
+
+# Class definitions ==========================================================
+class KeyVerseSet:
+    """
+    A sorted, duplicate free array of key verse ids, with a set of them for
+    O(1) membership. Iterating gives Verse objects, in order, so it can be
+    used wherever a list of key Verses was.
+    """
+
+    def __init__(self, vids=()):
+        self.ids = frozenset(vids)
+        self.vids = array('i', sorted(self.ids))
+
+    def __len__(self):
+        return len(self.vids)
+
+    def __contains__(self, verse):
+        return getattr(verse, "vid", verse) in self.ids
+
+    def __iter__(self):
+        return map(Verse.from_id, self.vids)
+
+    def __or__(self, other):
+        return KeyVerseSet(self.ids | other.ids)
+
+    def between(self, first, last):
+        """
+        Returns the key verse ids from verse id first to last, both included.
+        """
+        return self.vids[bisect.bisect_left(self.vids, first):bisect.bisect_right(self.vids, last)]
+
+    def books(self):
+        """
+        Returns the names of the books with key verses, in order.
+        """
+        return [Corpus.BOOKS[book] for book in dict.fromkeys(vid >> 16 for vid in self.vids)]
+
+    def to_string(self):
+        """
+        i.e. "1 Timothy 1:15-17, 2:5-6, Titus 1:9"
+        """
+        return References.format_reference(self.vids)
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="KeyVerses",
+                                     description="Reads a key verse .csv and lists the verses in it.")
+    parser.add_argument("csv", nargs='+', help="Key verse .csv files")
+    parser.add_argument("--book", help="Book to use for rows with no book")
+    options = parser.parse_args()
+
+    key_verses = KeyVerseSet()
+    for path in options.csv:
+        key_verses = key_verses | read_key_verses(path, options.book)
+    print(key_verses.to_string())
+    print(f"{len(key_verses)} key verses in {', '.join(key_verses.books())}")
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Each meet of the season only covers the chapters studied so far. The
+    meets, and the chapters each one covers, are listed in
+    configs/meet_schedule.yml, i.e.
+        Meet 3: "1 Thessalonians 1 - 1 Timothy 3"
+    and a pool is cut down to a meet's chapters with a VerseIndex: the pool
+    sorted by each question's first verse id, so every chapter range is one
+    bisect into the sorted ids (and a check of the few questions whose last
+    verse runs past the range), rather than a look at every question. The
+    same index serves every meet of the season.
+"""
+# Imports ====================================================================
+import argparse
+import bisect
+import os
+import re
+import sys
+from array import array
+
+absolute_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(absolute_path, "../Common"))
+
+import Corpus  # noqa: E402
+import Startup  # noqa: E402
+
+# Constants ==================================================================
+schedule_path = os.path.join(absolute_path, "../../../configs/meet_schedule.yml")
+
+# Between the two ends of a range of chapters
+_range_pattern = re.compile(r"\s*(?:-|–|—|\bthrough\b|\bto\b)\s*", re.IGNORECASE)
+
+
+# Function definitions =======================================================
+def chapter_bound(text, book=None, end=False):
+    """
+    Returns (verse id, book number) of one end of a chapter range: a book
+    ("1 Timothy"), a book and chapter ("1 Timothy 3"), or only a chapter
+    ("3", in book). The start of a range is its first verse, and the end its
+    last.
+    """
+    text = " ".join(text.split())
+    try:
+        book = Corpus.book_index(text)
+        chapter = None
+    except KeyError:
+        name, _, chapter = text.rpartition(" ")
+        if name:
+            book = Corpus.book_index(name)
+        assert book is not None, f'"{text}" has no book'
+        assert chapter.isdigit(), f'"{text}" is not a book or a chapter'
+        chapter = int(chapter)
+    if chapter is None:
+        return (book << 16 | 0xFFFF if end else book << 16), book
+    return (book << 16 | chapter << 8 | 0xFF if end else book << 16 | chapter << 8), book
+
+
+def chapter_range(text):
+    """
+    Returns (first verse id, last verse id) of a range of chapters, i.e.
+    "1 Thessalonians 1 - 1 Timothy 3", "Hebrews 1-4", "Titus 2" or "Philemon".
+    """
+    ends = _range_pattern.split(text.strip())
+    assert 1 <= len(ends) <= 2, f'"{text}" should be one chapter or book, or two joined by "-"'
+    first, book = chapter_bound(ends[0])
+    last, _ = chapter_bound(ends[-1], book if len(ends) == 2 else None, end=True)
+    assert first <= last, f'"{text}" ends before it starts'
+    return first, last
+
+
+def range_to_string(first, last):
+    """
+    The reverse of chapter_range, i.e. "1 Thessalonians 1 - 1 Timothy 3"
+    """
+    first_book, first_chapter, _ = Corpus.split_verse_id(first)
+    last_book, last_chapter, _ = Corpus.split_verse_id(last)
+    start = Corpus.BOOKS[first_book] + (f" {first_chapter}" if first_chapter else "")
+    end = Corpus.BOOKS[last_book] + (f" {last_chapter}" if last_chapter != 0xFF else "")
+    if start == end:
+        return start
+    if first_book == last_book and first_chapter and last_chapter != 0xFF:
+        return f"{start}-{last_chapter}"
+    return f"{start} - {end}"
+
+
+def merge_ranges(ranges):
+    """
+    Returns ranges sorted, with overlapping or touching ranges joined.
+    """
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+
+def validate_schedule(schedule):
+    """
+    Checks meet_schedule.yml, and turns every meet into its merged verse id
+    ranges: {meet name: [[first, last], ...]}. Run when the schedule changes,
+    see Startup.load_config.
+    """
+    assert isinstance(schedule, dict) and isinstance(schedule.get("Meets"), dict), \
+        "meet_schedule.yml needs a list of Meets"
+    meets = {}
+    for meet, chapters in schedule["Meets"].items():
+        if isinstance(chapters, str):
+            chapters = [chapters]
+        assert chapters, f"{meet} covers no chapters"
+        try:
+            meets[str(meet)] = merge_ranges(chapter_range(str(text)) for text in chapters)
+        except KeyError as error:
+            raise ValueError(f"{meet}: unknown book {error}") from None
+    return meets
+
+
+def load_schedule(path=schedule_path):
+    """
+    Returns {meet name: verse id ranges} from meet_schedule.yml.
+    """
+    return Startup.load_config(path, validate_schedule)
+
+
+# Class definitions ==========================================================
+class VerseIndex:
+    """
+    A pool of questions (anything with verse_ids()), sorted by first verse.
+    """
+
+    def __init__(self, questions):
+        spans = [(min(vids), max(vids)) for vids in (question.verse_ids() for question in questions)]
+        order = sorted(range(len(spans)), key=spans.__getitem__)
+        self.questions = [questions[index] for index in order]
+        self.starts = array('i', (spans[index][0] for index in order))
+        self.ends = array('i', (spans[index][1] for index in order))
+
+    def __len__(self):
+        return len(self.questions)
+
+    def between(self, first, last):
+        """
+        Returns the questions whose verses are all from verse id first to
+        last.
+        """
+        low = bisect.bisect_left(self.starts, first)
+        high = bisect.bisect_right(self.starts, last)
+        ends = self.ends
+        return [self.questions[index] for index in range(low, high) if ends[index] <= last]
+
+    def select(self, ranges):
+        """
+        Returns the questions within any of a meet's ranges (from
+        load_schedule), in verse order.
+        """
+        found = []
+        for first, last in ranges:
+            found.extend(self.between(first, last))
+        return found
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="MeetSchedule",
+                                     description="Lists the chapters of every meet, and its questions in a library.")
+    parser.add_argument("--library", help="Question .csv to count the questions of each meet in")
+    parser.add_argument("--book", help="Book to use if the library has no Book column")
+    options = parser.parse_args()
+
+    index = None
+    if options.library:
+        import QuestionStore
+        store = QuestionStore.QuestionStore.from_csv(options.library, options.book)
+        index = VerseIndex(list(store))
+    for meet, ranges in load_schedule().items():
+        chapters = ", ".join(range_to_string(first, last) for first, last in ranges)
+        counted = f", {len(index.select(ranges))} questions" if index is not None else ""
+        print(f"{meet}: {chapters}{counted}")
@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Holds a whole question library in a handful of flat arrays instead of one
+    Question object (with its Verse objects, strings and flags) per question:
+        types   : one byte per question, a code into the list of type names
+        keys    : one bit per question, set if it is about a key verse
+        verses  : first and last verse id of each question (int32), and every
+                  verse id of every question laid end to end, with offsets
+        text    : prompts and answers as numbers into one string table, where
+                  each distinct string is stored once, as utf-8
+    A million questions take tens of MB this way, and a saved store is read
+    back with a few array reads.
+
+    store[index] gives a QuestionView, which has the same attributes and
+    methods as a QuizGen Question, so pools can hold either.
+
+    from_csv reads a question .csv straight into a store, a chunk of rows at
+    a time, with its columns found by their header names (see csv_schema).
+
+File layout (all integers little-endian):
+    header  : magic, version, number of questions, verse ids, strings,
+              string bytes (u32)
+    types   : the type names, utf-8, newline separated
+    arrays  : types (u8), keys (bitmap), verse start, verse end, verse
+              offsets, verse ids, prompts, answers, string offsets (int32s)
+    strings : every distinct string, utf-8, back to back
+"""
+# Imports ====================================================================
+import argparse
+import csv
+import hashlib
+import itertools
+import operator
+import os
+import struct
+import sys
+from array import array
+
+absolute_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(absolute_path, "../Common"))
+
+import Corpus  # noqa: E402
+import References  # noqa: E402
+
+# Constants ==================================================================
+MAGIC = b"CQSTORE1"
+VERSION = 1
+_header = struct.Struct("<8sIIIII")
+
+# The header names each column of a question .csv can have (case and spacing
+# don't matter). The Book column can be left out if a default book is given.
+column_names = {
+    "book": ("Book",),
+    "reference": ("Reference", "Ref"),
+    "type": ("Question Type", "Type"),
+    "prompt": ("Question", "Prompt"),
+    "answer": ("Answer",),
+}
+CHUNK_SIZE = 4096   # rows read before they are added to a store
+
+
+# Function definitions =======================================================
+def question_id(vids, _type, prompt):
+    """
+    Returns a short id for a question that survives it being written out and
+    read back: a hash of its reference, type and prompt words, ignoring case,
+    punctuation and spacing. i.e. "3f09a1c47be2d815"
+    """
+    key = "|".join((References.format_reference(vids), _type.strip().upper(),
+                    " ".join(Corpus.tokenize(prompt))))
+    return hashlib.blake2b(key.encode("utf8"), digest_size=8).hexdigest()
+
+
+def csv_columns(header, default_book=None, path="The question .csv"):
+    """
+    Returns {field: column number} of the fields of column_names in the
+    header of a question .csv, with a book of None if there is no Book column
+    (and default_book is given).
+    """
+    found = {" ".join(name.split()).lower(): index for index, name in enumerate(header)}
+    columns = {}
+    for field, names in column_names.items():
+        columns[field] = next((found[name.lower()] for name in names if name.lower() in found), None)
+        if field != "book":
+            assert columns[field] is not None, f"{path} has no {names[0]} column"
+    if columns["book"] is None:
+        assert default_book, f"{path} has no Book column, a default book is needed"
+    return columns
+
+
+def csv_schema(header, default_book=None, path="The question .csv"):
+    """
+    Maps the header of a question .csv to its columns by name, i.e.
+    "Book,Reference,Question Type,Question,Answer" or
+    "Question Type,Reference,Question,Answer" (with default_book).
+
+    Returns
+    -------
+    A function that takes a row and returns (book, reference, type, prompt,
+    answer)
+    """
+    columns = csv_columns(header, default_book, path)
+    if columns["book"] is None:
+        rest = operator.itemgetter(columns["reference"], columns["type"], columns["prompt"], columns["answer"])
+        return lambda row: (default_book,) + rest(row)
+    return operator.itemgetter(*columns.values())
+
+
+def read_csv(path, default_book=None):
+    """
+    Yields the (book, reference, type, prompt, answer) of every question in a
+    question .csv, one row at a time. Blank rows are skipped.
+    """
+    with open(path, mode='r', encoding='utf-8', newline='') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        header = next(csv_reader, None)
+        assert header, f"{path} is empty"
+        schema = csv_schema(header, default_book, path)
+        yield from map(schema, filter(any, csv_reader))
+
+
+# Class definitions ==========================================================
+class StringTable:
+    """
+    Every distinct string once, as utf-8 in one buffer, numbered in the order
+    they were first added.
+    """
+
+    def __init__(self, data=b"", offsets=None):
+        self.data = bytearray(data)
+        self.offsets = offsets if offsets is not None else array('i', [0])
+        self.ids = None  # string -> number, only kept while adding
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, text):
+        """
+        Returns the number of text, adding it if it's new.
+        """
+        if self.ids is None:
+            self.ids = {self[number]: number for number in range(len(self))}
+        number = self.ids.get(text)
+        if number is None:
+            number = len(self)
+            self.ids[text] = number
+            self.data += text.encode("utf8")
+            self.offsets.append(len(self.data))
+        return number
+
+    def add_many(self, texts):
+        """
+        Returns the numbers of a list of texts, adding the new ones, all at
+        once.
+        """
+        if self.ids is None:
+            self.ids = {self[number]: number for number in range(len(self))}
+        ids = self.ids
+        first_new = len(ids)
+        # The new texts, each once, in the order they first appear
+        new = list(itertools.filterfalse(ids.__contains__, dict.fromkeys(texts)))
+        ids.update(zip(new, itertools.count(first_new)))
+        encoded = list(map(str.encode, new))  # utf-8
+        self.offsets.extend(itertools.accumulate(map(len, encoded), initial=len(self.data)))
+        del self.offsets[first_new + 1]  # accumulate repeats the current end
+        self.data += b"".join(encoded)
+        return list(map(ids.__getitem__, texts))
+
+    def drop_ids(self):
+        """
+        Frees the string -> number map once nothing more is being added. It
+        is as big as the strings themselves several times over, and is
+        rebuilt if anything is added later.
+        """
+        self.ids = None
+
+    def __getitem__(self, number):
+        return self.data[self.offsets[number]:self.offsets[number + 1]].decode("utf8")
+
+
+class QuestionStore:
+    """
+    A columnar question library. Questions are numbered from 0 in the order
+    they are added.
+    """
+
+    def __init__(self):
+        self.type_names = []
+        self.type_codes = {}
+        self.types = array('B')
+        self.keys = bytearray()
+        self.verse_start = array('i')
+        self.verse_end = array('i')
+        self.verse_offsets = array('i', [0])
+        self.verse_ids = array('i')
+        self.prompts = array('i')
+        self.answers = array('i')
+        self.strings = StringTable()
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Question {index} out of range")
+        return QuestionView(self, index % len(self))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield QuestionView(self, index)
+
+    def add(self, _type, prompt, answer, vids, is_key=False):
+        """
+        Adds a question about the given verse ids, and returns its number.
+        """
+        assert vids, f"Question has no verses: {prompt}"
+        code = self.type_codes.get(_type)
+        if code is None:
+            assert len(self.type_names) < 256, "Too many question types"
+            code = self.type_codes[_type] = len(self.type_names)
+            self.type_names.append(_type)
+        index = len(self.types)
+        self.types.append(code)
+        if index % 8 == 0:
+            self.keys.append(0)
+        self.set_key(index, is_key)
+        self.verse_start.append(min(vids))
+        self.verse_end.append(max(vids))
+        self.verse_ids.extend(vids)
+        self.verse_offsets.append(len(self.verse_ids))
+        self.prompts.append(self.strings.add(prompt))
+        self.answers.append(self.strings.add(answer))
+        return index
+
+    def set_key(self, index, is_key=True):
+        if is_key:
+            self.keys[index >> 3] |= 1 << (index & 7)
+        else:
+            self.keys[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def is_key(self, index):
+        return bool(self.keys[index >> 3] & (1 << (index & 7)))
+
+    def mark_keys(self, key_ids):
+        """
+        Flags every question that is about at least one of the key verse ids.
+        """
+        key_ids = frozenset(key_ids)
+        offsets, verse_ids = self.verse_offsets, self.verse_ids
+        for index in range(len(self)):
+            self.set_key(index, not key_ids.isdisjoint(verse_ids[offsets[index]:offsets[index + 1]]))
+
+    def type_of(self, index):
+        return self.type_names[self.types[index]]
+
+    def prompt_of(self, index):
+        return self.strings[self.prompts[index]]
+
+    def answer_of(self, index):
+        return self.strings[self.answers[index]]
+
+    def verse_ids_of(self, index):
+        return self.verse_ids[self.verse_offsets[index]:self.verse_offsets[index + 1]].tolist()
+
+    def indexes(self, _type=None, is_key=None):
+        """
+        Returns the numbers of the questions of a type (as written in the
+        library, i.e. "CRMA"), and/or with the given key flag.
+        """
+        code = None
+        if _type is not None:
+            code = self.type_codes.get(_type)
+            if code is None:
+                return []
+        return [index for index in range(len(self))
+                if (code is None or self.types[index] == code)
+                and (is_key is None or self.is_key(index) == is_key)]
+
+    def views(self, indexes):
+        return [QuestionView(self, index) for index in indexes]
+
+    def extend(self, rows, key_ids=(), parsed=None):
+        """
+        Adds (book, reference, type, prompt, answer) rows, i.e. the question
+        .csv without its header, a column at a time.
+
+        parsed : {(book, reference): verse ids}, the references read so far,
+            to share between calls. Each distinct reference is only parsed
+            once.
+        """
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        assert len(columns) >= 5, "Every question row needs a book, reference, type, prompt and answer"
+        self.extend_columns(*columns[:5], key_ids, parsed)
+
+    def extend_columns(self, books, references, types, prompts, answers, key_ids=(), parsed=None):
+        """
+        Adds questions given as columns (lists of the same length), see
+        extend.
+        """
+        if parsed is None:
+            parsed = {}
+        places = list(zip(books, references))
+        for place in set(places).difference(parsed):
+            parsed[place] = References.parse(*place)
+        vids = list(map(parsed.__getitem__, places))
+        assert all(vids), "Every question needs a reference"
+
+        for _type in dict.fromkeys(types):
+            if _type not in self.type_codes:
+                assert len(self.type_names) < 256, "Too many question types"
+                self.type_codes[_type] = len(self.type_names)
+                self.type_names.append(_type)
+        first = len(self)
+        self.types.extend(map(self.type_codes.__getitem__, types))
+        self.verse_start.extend(map(min, vids))
+        self.verse_end.extend(map(max, vids))
+        self.verse_offsets.extend(itertools.accumulate(map(len, vids), initial=len(self.verse_ids)))
+        del self.verse_offsets[first + 1]  # accumulate repeats the current end
+        self.verse_ids.extend(itertools.chain.from_iterable(vids))
+        self.prompts.extend(self.strings.add_many(prompts))
+        self.answers.extend(self.strings.add_many(answers))
+
+        self.keys.extend(bytes((len(self) + 7) // 8 - len(self.keys)))
+        key_ids = frozenset(key_ids)
+        if key_ids:
+            for index, question_vids in enumerate(vids, start=first):
+                if not key_ids.isdisjoint(question_vids):
+                    self.set_key(index)
+
+    @classmethod
+    def from_rows(cls, rows, key_ids=()):
+        """
+        Builds a store from (book, reference, type, prompt, answer) rows.
+        """
+        store = cls()
+        store.extend(rows, key_ids)
+        store.strings.drop_ids()
+        return store
+
+    @classmethod
+    def from_csv(cls, path, default_book=None, key_ids=(), chunk_size=CHUNK_SIZE):
+        """
+        Builds a store from a question .csv of either layout (see csv_schema),
+        CHUNK_SIZE rows at a time, so the file is never held as a list of
+        rows. Each chunk is cut straight into its columns.
+        """
+        store = cls()
+        key_ids = frozenset(key_ids)
+        parsed = {}
+        with open(path, mode='r', encoding='utf-8', newline='') as csv_file:
+            csv_reader = csv.reader(csv_file, delimiter=',')
+            header = next(csv_reader, None)
+            assert header, f"{path} is empty"
+            columns = csv_columns(header, default_book, path)
+            getters = [operator.itemgetter(columns[field]) for field in ("reference", "type", "prompt", "answer")]
+            rows = filter(any, csv_reader)
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                if columns["book"] is None:
+                    books = itertools.repeat(default_book, len(chunk))
+                else:
+                    books = map(operator.itemgetter(columns["book"]), chunk)
+                store.extend_columns(list(books), *(list(map(getter, chunk)) for getter in getters),
+                                     key_ids=key_ids, parsed=parsed)
+        store.strings.drop_ids()
+        return store
+
+    def save(self, path):
+        names = "\n".join(self.type_names).encode("utf8")
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(_header.pack(MAGIC, VERSION, len(self), len(self.verse_ids),
+                                    len(self.strings), len(self.strings.data)))
+            file.write(struct.pack("<I", len(names)))
+            file.write(names)
+            file.write(self.types.tobytes())
+            file.write(bytes(self.keys))
+            for values in (self.verse_start, self.verse_end, self.verse_offsets, self.verse_ids,
+                           self.prompts, self.answers, self.strings.offsets):
+                if sys.byteorder != "little":
+                    values = array('i', values)
+                    values.byteswap()
+                file.write(values.tobytes())
+            file.write(self.strings.data)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, count, num_verses, num_strings, string_bytes = _header.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} question store")
+        cursor = _header.size
+        names_size = struct.unpack_from("<I", data, cursor)[0]
+        cursor += 4
+        store = cls()
+        store.type_names = data[cursor:cursor + names_size].decode("utf8").split("\n") if names_size else []
+        store.type_codes = {name: code for code, name in enumerate(store.type_names)}
+        cursor += names_size
+        store.types = array('B', data[cursor:cursor + count])
+        cursor += count
+        store.keys = bytearray(data[cursor:cursor + (count + 7) // 8])
+        cursor += (count + 7) // 8
+
+        arrays = []
+        for length in (count, count, count + 1, num_verses, count, count, num_strings + 1):
+            values = array('i')
+            values.frombytes(data[cursor:cursor + 4 * length])
+            if sys.byteorder != "little":
+                values.byteswap()
+            arrays.append(values)
+            cursor += 4 * length
+        (store.verse_start, store.verse_end, store.verse_offsets, store.verse_ids,
+         store.prompts, store.answers, string_offsets) = arrays
+        store.strings = StringTable(data[cursor:cursor + string_bytes], string_offsets)
+        return store
+
+
+class QuestionView:
+    """
+    One question of a QuestionStore, with the attributes and methods of a
+    QuizGen Question. Nothing is copied out of the store until it's asked for.
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __eq__(self, other):
+        if not isinstance(other, QuestionView):
+            return NotImplemented
+        return self.store is other.store and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def _type(self):
+        # Like Question, CRs and CRMAs are one category
+        _type = self.store.type_of(self.index)
+        return "CR" if _type == "CRMA" else _type
+
+    @property
+    def is_crma(self):
+        return self.store.type_of(self.index) == "CRMA"
+
+    @property
+    def prompt(self):
+        return self.store.prompt_of(self.index)
+
+    @property
+    def answer(self):
+        return self.store.answer_of(self.index)
+
+    @property
+    def is_key(self):
+        return self.store.is_key(self.index)
+
+    @property
+    def is_multiple(self):
+        offsets = self.store.verse_offsets
+        return offsets[self.index + 1] - offsets[self.index] > 1
+
+    @property
+    def verse(self):
+        return self.get_verses()
+
+    def get_verses(self):
+        return [References.Verse.from_id(vid) for vid in self.store.verse_ids_of(self.index)]
+
+    def verse_ids(self):
+        return sorted(self.store.verse_ids_of(self.index))
+
+    def reference(self):
+        return References.format_reference(self.verse_ids())
+
+    def question_id(self):
+        return question_id(self.verse_ids(), self._type, self.prompt)
+
+    def to_string(self):
+        buildup = self.reference()
+        if (self.is_crma):
+            return (buildup + ",CRMA" + "," + self.prompt + "," + self.answer)
+        else:
+            return (buildup + "," + self._type + "," + self.prompt + "," + self.answer)
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="QuestionStore",
+                                     description="Packs a question .csv into a question store file.")
+    parser.add_argument("csv", help="Question .csv, with a Reference, Question Type, Question, Answer header")
+    parser.add_argument("store", help="Where to save the store")
+    parser.add_argument("--book", help="Book to use if the .csv has no Book column")
+    options = parser.parse_args()
+
+    store = QuestionStore.from_csv(options.csv, options.book)
+    store.save(options.store)
+    print(f"{len(store)} questions, {len(store.strings)} distinct strings, saved to {options.store}")
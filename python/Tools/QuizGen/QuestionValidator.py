@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Checks the hand-typed QT and FTV questions in the question .csv files
+    against the verse text in the packed corpus.
+        -QT answers must be the text of the referenced verse(s)
+        -FTV prompt + answer must put the verse(s) back together
+        -FTV prompts must identify their verse among the other verses of
+         the books in the same file (see Common/VersePrefixes.py)
+    Case and punctuation are ignored, only the words are compared.
+    Every mismatch is reported with a word diff.
+
+    Verses come from the prebuilt corpus (see Common/Corpus.py), and each
+    reference is only looked up and split into words once, so large files
+    validate quickly.
+"""
+# Imports ====================================================================
+import argparse
+import csv
+import difflib
+import os
+import sys
+
+absolute_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(absolute_path, "../Common"))
+
+import Corpus  # noqa: E402
+import References  # noqa: E402
+import VersePrefixes  # noqa: E402
+import QuestionStore  # noqa: E402
+
+# Constants ==================================================================
+resources_path = os.path.join(absolute_path, "../../../resources/")
+
+# Files checked when none are given, with the book to use if they have no
+# Book column
+default_libraries = [
+    (os.path.join(resources_path, "questions/2023-24-practice-session-questions.csv"), None),
+    (os.path.join(resources_path, "Hebrews/questions/HebrewsQuestionsFinal.csv"), "Hebrews"),
+]
+
+verse_types = ("QT", "FTV")
+
+
+# Class definitions ==========================================================
+class Mismatch:
+    """
+    One question whose text doesn't match the verse(s) it references.
+    """
+
+    def __init__(self, path, line, reference, _type, problem, diff=""):
+        self.path = path
+        self.line = line
+        self.reference = reference
+        self._type = _type
+        self.problem = problem
+        self.diff = diff
+
+    def to_string(self):
+        buildup = f"{os.path.basename(self.path)}:{self.line} {self.reference} {self._type}: {self.problem}"
+        if self.diff:
+            buildup += "\n    " + self.diff
+        return buildup
+
+
+class VerseLookup:
+    """
+    Reference string -> normalized words of the verse(s), cached, since the
+    same references come up again and again (a QT and FTV for every verse).
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.cache = {}
+
+    def words(self, book, reference):
+        """
+        Returns the tuple of words of the referenced verses.
+        Raises KeyError if a verse isn't in the corpus, ValueError if the
+        reference can't be read.
+        """
+        key = (book, reference)
+        found = self.cache.get(key)
+        if found is None:
+            words = []
+            for vid in References.parse(book, reference):
+                words.extend(Corpus.tokenize(self.corpus.text(vid)))
+            found = tuple(words)
+            self.cache[key] = found
+        return found
+
+
+# Function definitions =======================================================
+def word_diff(expected, found):
+    """
+    Returns a short diff of two word lists, i.e.
+    "...turned to God [-from +for] idols..."
+    """
+    pieces = []
+    matcher = difflib.SequenceMatcher(a=expected, b=found, autojunk=False)
+    for tag, a_start, a_end, b_start, b_end in matcher.get_opcodes():
+        if tag == "equal":
+            if a_end - a_start > 6:
+                pieces.append(" ".join(expected[a_start:a_start + 3]) + " ... "
+                              + " ".join(expected[a_end - 3:a_end]))
+            else:
+                pieces.append(" ".join(expected[a_start:a_end]))
+            continue
+        change = []
+        if a_end > a_start:
+            change.append("-" + " ".join(expected[a_start:a_end]))
+        if b_end > b_start:
+            change.append("+" + " ".join(found[b_start:b_end]))
+        pieces.append("[" + " ".join(change) + "]")
+    return " ".join(piece for piece in pieces if piece)
+
+
+def read_rows(path, default_book=None):
+    """
+    Reads a question .csv, mapping columns by their header names (see
+    QuestionStore.csv_schema).
+
+    Returns
+    -------
+    A list of (line number, book, reference, type, prompt, answer)
+    """
+    rows = []
+    with open(path, mode='r', encoding='utf-8') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        schema = QuestionStore.csv_schema(next(csv_reader), default_book, path)
+        for line, row in enumerate(csv_reader, start=2):
+            if not any(row):
+                continue
+            rows.append((line,) + schema(row))
+    return rows
+
+
+def validate_rows(path, rows, lookup, prefixes=None):
+    """
+    Checks every QT and FTV row against the verse text.
+    If prefixes (from VersePrefixes) are given, FTV prompts that don't
+    identify their verse are reported too.
+
+    Returns
+    -------
+    (number of rows checked, list of Mismatch)
+    """
+    checked = 0
+    mismatches = []
+    for line, book, reference, _type, prompt, answer in rows:
+        if _type not in verse_types:
+            continue
+        checked += 1
+        full_reference = f"{book} {reference}"
+        try:
+            expected = lookup.words(book, reference)
+        except (KeyError, ValueError) as error:
+            mismatches.append(Mismatch(path, line, full_reference, _type,
+                                       f"reference not found ({error})"))
+            continue
+
+        if _type == "QT":
+            found = tuple(Corpus.tokenize(answer))
+            problem = "answer is not the verse text"
+        else:
+            found = tuple(Corpus.tokenize(prompt + " " + answer))
+            problem = "prompt + answer is not the verse text"
+            if not Corpus.tokenize(prompt):
+                mismatches.append(Mismatch(path, line, full_reference, _type, "prompt is empty"))
+                continue
+        if found != expected:
+            mismatches.append(Mismatch(path, line, full_reference, _type, problem,
+                                       word_diff(list(expected), list(found))))
+        elif _type == "FTV" and prefixes is not None:
+            vids = References.parse(book, reference)
+            prefix = prefixes.get(vids[0])
+            if prefix is not None and prefix.is_ambiguous(len(prompt.split())):
+                others = ", ".join(Corpus.verse_id_to_string(other) for other in prefix.collisions)
+                needed = prefix.unique_length or "every"
+                mismatches.append(Mismatch(path, line, full_reference, _type,
+                                           f"prompt doesn't identify the verse, {needed} words needed"
+                                           + (f" (shares its start with {others})" if others else "")))
+    return checked, mismatches
+
+
+def validate_files(libraries, corpus):
+    """
+    Validates every (path, default book) in libraries.
+
+    Returns
+    -------
+    (number of rows checked, list of Mismatch)
+    """
+    lookup = VerseLookup(corpus)
+    total = 0
+    mismatches = []
+    for path, default_book in libraries:
+        rows = read_rows(path, default_book)
+        books = []
+        for row in rows:
+            if row[1] not in books:
+                books.append(row[1])
+        prefixes = VersePrefixes.corpus_prefixes(corpus, books)
+        checked, found = validate_rows(path, rows, lookup, prefixes)
+        total += checked
+        mismatches.extend(found)
+    return total, mismatches
+
+
+# Main =======================================================================
+def main():
+    parser = argparse.ArgumentParser(prog="QuestionValidator",
+                                     description="Checks QT and FTV questions against the verse text.")
+    parser.add_argument("files", nargs='*',
+                        help="Question .csv files to check (defaults to the practice and Hebrews libraries)")
+    parser.add_argument("--book",
+                        help="Book to use for files with no Book column")
+    options = parser.parse_args()
+
+    if options.files:
+        libraries = [(path, options.book) for path in options.files]
+    else:
+        libraries = default_libraries
+
+    with Corpus.load_corpus() as corpus:
+        checked, mismatches = validate_files(libraries, corpus)
+
+    for mismatch in mismatches:
+        print(mismatch.to_string())
+    print(f"{checked} QT/FTV questions checked, {len(mismatches)} mismatches.")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
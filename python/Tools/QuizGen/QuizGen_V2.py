@@ -10,14 +10,83 @@ Purpose:
     quizzes based on those parameters.
 """
 # Imports ====================================================================
-import csv
+import argparse
 import random
 import os
 import sys
-import yaml
 
 from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../Common"))
+import Corpus  # noqa: E402
+import Startup  # noqa: E402
+import VersePrefixes  # noqa: E402
+import References  # noqa: E402
+from References import Verse  # noqa: E402
+import Dedupe  # noqa: E402
+import QuestionStore  # noqa: E402
+import Export  # noqa: E402
+import KeyVerses  # noqa: E402
+import MeetSchedule  # noqa: E402
+import QuizHistory  # noqa: E402
+import Sampler  # noqa: E402
+import UsageLedger  # noqa: E402
+
 # Constants ==================================================================
+# What to do when key questions of a type run out, see get_key_question
+shortage_policies = ("ask", "substitute", "fail")
+shortage_policy = "ask"
+debug = False
+
+# Config validation ==========================================================
+# Run when a config has changed, see Startup.load_config
+def validate_config(config):
+    assert isinstance(config, dict), "quizgen_config.yml is empty"
+    for key in ("QuestionsCSV", "KeyVersesCSV", "ResultsDirectory"):
+        assert key in config.get("Paths", {}), f"quizgen_config.yml needs Paths: {key}"
+    config.setdefault("ExportFormat", "files")
+    assert config["ExportFormat"] in Export.formats, f"ExportFormat must be one of {Export.formats}"
+    for key in ("NumberToGenerate", "Seed"):
+        assert config.get(key) is None or isinstance(config[key], int), f"{key} must be a whole number"
+    if config.get("Meet") is not None:
+        config["Meet"] = str(config["Meet"])
+    half_life = config.get("StalenessHalfLife")
+    assert half_life is None or isinstance(half_life, (int, float)), "StalenessHalfLife must be a number"
+    return config
+
+
+def validate_quiz_definition(definition):
+    """
+    Also writes every Distribution entry as "min,max", so "MA: 2" becomes
+    "2,2".
+    """
+    assert isinstance(definition, dict) and "Quiz" in definition, "quiz_definition.yml needs a Quiz section"
+    for section in (definition["Quiz"]["Questions"], definition.get("Backup Questions", {})):
+        if not section:
+            continue
+        assert isinstance(section.get("Number"), int), "Number of questions must be a whole number"
+        assert isinstance(section.get("RatioKey"), (int, float)), "RatioKey must be a number"
+        distribution = section.get("Distribution") or {}
+        minimum = 0
+        for _type, poss_range in distribution.items():
+            bounds = [int(bound) for bound in str(poss_range).split(',')]
+            if len(bounds) == 1:
+                bounds *= 2
+            assert len(bounds) == 2 and 0 <= bounds[0] <= bounds[1], f"{_type}: {poss_range} isn't min,max"
+            distribution[_type] = f"{bounds[0]},{bounds[1]}"
+            minimum += bounds[0]
+        assert minimum <= section["Number"], "Distribution minimums add up to more than Number"
+        section["Distribution"] = distribution
+    definition.setdefault("Backup Questions", {"Enabled": False})
+    return definition
+
+
+def validate_question_types(types):
+    assert isinstance(types, dict) and "Question Types" in types, "question_types.yml needs Question Types"
+    for _type, entry in types["Question Types"].items():
+        assert isinstance(entry.get("is_key_only"), bool), f"{_type} needs is_key_only: True or False"
+    return types
+
 
 # Configurations +============================================================
 absolute_path = os.path.dirname(__file__)
@@ -27,36 +96,12 @@ quizgen_config_path = os.path.join(config_path, "quizgen_config.yml")
 quiz_definition_path = os.path.join(config_path, "quiz_definition.yml")
 question_types_path = os.path.join(config_path, "question_types.yml")
 
-with open(quizgen_config_path, 'r') as file:
-    config = yaml.safe_load(file)
-
-with open(quiz_definition_path, 'r') as file:
-    quiz_definition = yaml.safe_load(file)
-    
-with open(question_types_path, 'r') as file:
-    question_types = yaml.safe_load(file)
+config = Startup.load_config(quizgen_config_path, validate_config)
+quiz_definition = Startup.load_config(quiz_definition_path, validate_quiz_definition)
+question_types = Startup.load_config(question_types_path, validate_question_types)
 
 
 # Class definitions ==========================================================
-class Verse:
-    def __init__(self, book, chapter, verse):
-        self.book = book
-        self.chapter = chapter
-        self.verse = verse
-        
-    def __eq__(self, other): 
-        if not isinstance(other, Verse):
-            # don't attempt to compare against unrelated types
-            return NotImplemented
-
-        return (self.book == other.book) and (self.chapter == other.chapter)\
-            and (self.verse == other.verse)
-    
-    def to_string(self):
-        buildup = "" + self.book + " " + self.chapter + ":" + self.verse
-        return buildup
-
-
 class Question:
     """
     A Question object that consists of a question type, a prompt, an answer
@@ -73,7 +118,7 @@ class Question:
             self._type = "CR"
             self.is_crma = True
         else:
-            self.is_crma = True
+            self.is_crma = False
             self._type = _type
         self.prompt = prompt
         self.answer = answer
@@ -86,28 +131,28 @@ class Question:
             self.verse = verse[0]
             self.is_multiple = False
 
+    def verse_ids(self):
+        """
+        Returns the sorted verse ids of the verses this question is about.
+        """
+        return sorted(vs.vid for vs in self.get_verses())
+    
+    def reference(self):
+        """
+        Returns this question's verses as one reference, i.e.
+        "Hebrews 1:9-2:3", with runs of verses joined into ranges.
+        """
+        return References.format_reference(self.verse_ids())
+    
+    def question_id(self):
+        """
+        Returns an id that matches this question in a written quiz, see
+        QuestionStore.question_id.
+        """
+        return QuestionStore.question_id(self.verse_ids(), self._type, self.prompt)
+
     def to_string(self):
-        if (self.is_multiple is True):
-            # Have to back-compile this to "book ch:vs-vs" form.
-            # First check to see if all verses are in the same chapter
-            verses = self.verse
-            diff_chapters = any([chap != other for chap in [vs.chapter for vs in verses]
-                                 for other in [vs.chapter for vs in verses]])
-            if (diff_chapters is True):
-                # Now buildup "book first_ref - second_ref"
-                buildup = "" + verses[0].book + " " + verses[0].chapter + ":"\
-                    + verses[0].verse + "-" + verses[-1].chapter + ":" +\
-                    verses[-1].verse
-            else:
-                # Easy. Just buildup book chapter:vs-vs
-                buildup = "" + verses[0].book + " " + verses[0].chapter + ":"\
-                    + verses[0].verse + "-" + verses[-1].verse
-            
-        else:
-            # sample of what this looks like right now
-            # ([<__main__.Verse object at 0x000001F3FFABD0D0>],)
-            # Should have removed the tuple now.
-            buildup = "" + self.verse[0].to_string()
+        buildup = self.reference()
         
         # Due to combination of CRs and CRMAs above, we need to preserve the
         # CRMA types. This allows us to specify a range of CRs, but really get
@@ -118,7 +163,6 @@ class Question:
             return (buildup + "," + self._type + "," + self.prompt + "," + self.answer)
     
     def get_verses(self):
-        print([item for item in self.verse])
         return [item for item in self.verse]
 
 
@@ -186,70 +230,148 @@ class Quiz:
         # Shuffle the quiz
         random.shuffle(question_set)
         self.question_set = question_set
+    
+    @classmethod
+    def from_questions(cls, question_set, seed=None):
+        """
+        A Quiz of questions drawn some other way, i.e. backup questions from
+        a BackupReservoir, so it can be written out like any other.
+        """
+        quiz = cls.__new__(cls)
+        quiz.question_set = list(question_set)
+        quiz.seed = seed
+        return quiz
         
     def to_string(self):
         buildup = ""
         for index, question in enumerate(self.question_set):
             buildup += str(index + 1) + ". "
-            for item in question.get_verses():
-                buildup += item.to_string()
+            buildup += question.reference()
             buildup += "\n " + question._type
             buildup += "\n " + question.prompt
             buildup += "\n " + question.answer + "\n"
         return buildup
 
 
+class BackupReservoir:
+    """
+    Where backup questions come from. Only how many of each type it can give
+    is decided ahead, from the Backup Questions section of
+    quiz_definition.yml, and each backup is drawn from the pools when it is
+    asked for, so questions that are never needed stay in the pools.
+    
+    Each quiz drawn for the backup console (or a QuizService room) has one,
+    to draw backups one at a time while the quiz is run. A written packet's
+    list of backups is drawn all at once from one for the whole packet, see
+    draw_all.
+    
+    A backup is never one of the questions already asked (those of the quiz
+    or packet), or an earlier backup.
+    """
+    
+    def __init__(self, asked, pool_sampler, key_sampler, definition=None):
+        definition = definition or quiz_definition["Backup Questions"]
+        self.pool_sampler = pool_sampler
+        self.key_sampler = key_sampler
+        self.ratio_key = definition["RatioKey"]
+        self.capacity = {}
+        for qtype, poss_range in definition["Distribution"].items():
+            min_num, max_num = (int(bound) for bound in poss_range.split(','))
+            self.capacity[qtype] = random.randrange(min_num, max_num + 1)
+        default_qtype = definition.get("Default") or quiz_definition["Quiz"]["Questions"]["Default"]
+        leftover = definition["Number"] - sum(self.capacity.values())
+        self.capacity[default_qtype] = self.capacity.get(default_qtype, 0) + max(0, leftover)
+        self.used = {question.question_id() for question in asked}
+        self.drawn = []
+    
+    def remaining(self, qtype=None):
+        if qtype is None:
+            return sum(self.capacity.values())
+        return self.capacity.get(qtype, 0)
+    
+    def draw(self, qtype=None):
+        """
+        Returns a backup question of the given type (of any type with
+        backups left if not given), and takes it out of the pools.
+        Returns None if no more backups of that type can be given.
+        """
+        if qtype is None:
+            types = [smtg for smtg, count in self.capacity.items() if count > 0]
+            if not types:
+                return None
+            qtype = random.choices(types, [self.capacity[smtg] for smtg in types])[0]
+        if not self.remaining(qtype):
+            return None
+        key_only = question_types["Question Types"].get(qtype, {}).get("is_key_only", False)
+        while True:
+            use_key = key_only or random.random() <= self.ratio_key
+            question = (self.key_sampler if use_key else self.pool_sampler).draw(qtype)
+            if question is None and use_key and not key_only:
+                question = self.pool_sampler.draw(qtype)
+            if question is None:
+                return None
+            if question.question_id() not in self.used:
+                break
+        self.used.add(question.question_id())
+        self.capacity[qtype] -= 1
+        self.drawn.append(question)
+        return question
+    
+    def draw_all(self):
+        """
+        Draws every backup left, type by type, and returns them shuffled.
+        Types the pools have run out of give fewer backups.
+        """
+        questions = []
+        for qtype in list(self.capacity):
+            while self.remaining(qtype):
+                question = self.draw(qtype)
+                if question is None:
+                    print(f"Ran out of {qtype} questions for backups, {self.remaining(qtype)} fewer {qtype} backups.")
+                    self.capacity[qtype] = 0
+                    break
+                questions.append(question)
+        random.shuffle(questions)
+        return questions
+
+
 # Function definitions =======================================================
 def readQuestionLibrary():
     """
-    This function reads in the CSV of questions, and turns it into an array.
-    Relies on the path definition in quizgen_config.yml
+    This function reads in the CSV of questions, straight into a question
+    store. Relies on the path definitions in quizgen_config.yml
+    
+    The columns are found by their header names, so either the
+    "Book,Reference,Question Type,Question,Answer" layout or one with no Book
+    column (with QuestionsBook set) can be read, see QuestionStore.csv_schema.
 
     Returns
     -------
-    q_lib, an array of the data of the CSV
+    q_lib, a QuestionStore of the questions in the CSV
     """
-    q_lib = []
     lib_path = config["Paths"]["QuestionsCSV"]
     assert os.path.exists(lib_path), "File not found at, " + str(lib_path)
-    with open(lib_path, mode='r', encoding='utf-8') as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            q_lib.append(row)
-    return q_lib
+    return QuestionStore.QuestionStore.from_csv(lib_path, config["Paths"].get("QuestionsBook"))
 
 
 def readKeyList():
     """
-    This function reads in a CSV file of key verses, and makes a list of them
-    Relies on the path definition in quizgen_config.yml
+    This function reads in a CSV file of key verses, and makes a set of them
+    Relies on the path definitions in quizgen_config.yml
     
-    Assumed format of csv is book | verses | verses | verses
-                             book | verses | verses ...
+    Either format of csv can be read, see KeyVerses.py:
+        book | verses | verses | verses      (Memory-Verses.csv)
+        verses | verses | verses             (HebKey.csv, with QuestionsBook set)
                              
     Returns
     -------
-    key_verses : list of Verse type key verses
+    key_verses : a KeyVerses.KeyVerseSet, which gives Verse type key verses
+        in order, each once
 
     """
-
-    key_lib = []
     key_path = config["Paths"]["KeyVersesCSV"]
     assert os.path.exists(key_path), "Key verses file not found at, " + str(key_path)
-    with open(key_path, mode='r', encoding='utf-8') as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            key_lib.append(row)
-    
-    key_verses = []
-    for row in key_lib:
-        for index, reference in enumerate(row):
-            if (index != 0) and (bool(reference)):
-                temp_verse = create_verse(row[0], reference)
-                for item in temp_verse:
-                    key_verses.append(item)
-    #print(key_verses)
-    return key_verses
+    return KeyVerses.read_key_verses(key_path, config["Paths"].get("QuestionsBook"))
 
 
 # def create_verse(book, chapter, verse):
@@ -268,57 +390,33 @@ def create_verse(book, reference):
         Hebrews 1:1
         or
         Hebrews 1:1-2
+        or
+        Hebrews 1:9-2:3, 2:5
     And returns the appropriate number of verse objects.
+    See Common/References.py for every form a reference can take.
     """
-    verses = []
-    
-    assert ':' in reference, f"Invalid reference {book} {reference}"
-    reference = reference.split(':')
-    chapter = reference[0]
-    if '-' in reference[-1]:
-        multiple_verses = reference[-1].split('-')
-        # Multiple references identified. Need to create multiple verses
-        for item in range(int(multiple_verses[0]), int(multiple_verses[1]) + 1):
-            verses.append(Verse(book, chapter, str(item)))
-    else:
-        verses = [Verse(book, chapter, reference[1])]
-    
-    return verses
+    return [Verse.from_id(vid) for vid in References.parse(book, reference)]
 
 
 def gen_pools(q_lib, key_refs):
     """
-    This function takes q_lib, a plain array of questions,
+    This function takes q_lib, the store of every question,
     and sorts it into two pools of Question type.
 
     Parameters
     ----------
     q_lib : from readQuestionLibrary
-    key_refs : a list of references of the key verses
+    key_refs : the KeyVerseSet of the key verses
     Returns
     -------
-    pool : a list of non-key Questions
-    key_pool : a list of key Questions
-    """
-    pool = []
-    key_pool = []
-    # Assume first line is headers, and is in format:
-    # BOOK, REF, TYPE, PROMPT, ANSWER
-    q_lib = q_lib[1:]
-    # print("Lines:")
-    print(key_refs)
-    for line in q_lib:
-        # create the question first
-        # Need to determine reference!
-        #print(line)
-        temp_verse = create_verse(line[0], line[1])
-        current_q = Question(line[2], line[3], line[4], *[temp_verse])
-        # print(current_q.to_string())
-        # print(key_refs)
-        if any([vs == key_vs for key_vs in key_refs for vs in current_q.get_verses()]):
-            key_pool.append(current_q)
-        else:
-            pool.append(current_q)
+    pool : a list of non-key Questions (QuestionStore views)
+    key_pool : a list of key Questions (QuestionStore views)
+    """
+    print(key_refs.to_string())
+    # The pools hold lightweight views of the questions in the store
+    q_lib.mark_keys(key_refs.ids)
+    pool = q_lib.views(q_lib.indexes(is_key=False))
+    key_pool = q_lib.views(q_lib.indexes(is_key=True))
     print("Num of key questions found: ")
     print(len(key_pool))
     print("Num of reg qs found: ")
@@ -326,6 +424,58 @@ def gen_pools(q_lib, key_refs):
     return pool, key_pool
 
 
+def gen_verse_questions(key_verses, existing=(), corpus=None):
+    """
+    Builds a QT and an FTV question for every key verse, straight from the
+    verse text, so they don't need to be written by hand in the questions CSV.
+    FTV prompts are the first five words, or more if five words are shared
+    with another verse in the key verses' books.
+
+    Parameters
+    ----------
+    key_verses : the KeyVerseSet from readKeyList
+    existing : Questions already in the library. A verse that already has
+        a hand-written QT or FTV doesn't get a generated one of that type.
+    corpus : an open Corpus.PackedCorpus, loaded if not given
+
+    Returns
+    -------
+    questions : a list of QT and FTV Questions
+    """
+    if corpus is None:
+        corpus = Corpus.load_corpus()
+    written = set()
+    for question in existing:
+        if question._type in ("QT", "FTV"):
+            for vs in question.get_verses():
+                written.add((question._type, vs.vid))
+
+    prefixes = VersePrefixes.corpus_prefixes(corpus, key_verses.books())
+
+    questions = []
+    seen = set()
+    for vs in key_verses:
+        vid = vs.vid
+        if vid in seen:
+            continue
+        seen.add(vid)
+        reference = vs.to_string()
+        try:
+            text = corpus.text(vid)
+        except KeyError:
+            print(f"Key verse {reference} not found in the material, no QT/FTV made for it.")
+            continue
+
+        if ("QT", vid) not in written:
+            questions.append(Question("QT", f"Quote {reference}", text, [vs]))
+        words = text.split()
+        if ("FTV", vid) not in written and len(words) > 1:
+            num_prompt = prefixes[vid].prompt_length()
+            questions.append(Question("FTV", " ".join(words[:num_prompt]),
+                                      " ".join(words[num_prompt:]), [vs]))
+    return questions
+
+
 def get_key_question(q_type, pop=True):
     """
     Parameters
@@ -335,22 +485,24 @@ def get_key_question(q_type, pop=True):
     Returns
     -------
     A question, from the memory verses,
-    of the given type, and removes it from the pool of questions
+    of the given type, and removes it from the pool of questions.
+    Questions are drawn by weight, see gen_samplers.
     """
-    global key_pool
-    random.shuffle(key_pool)
-    for question in key_pool:
-        if question._type == q_type:
-            if pop:
-                key_pool.remove(question)
-            return question
+    global key_sampler
+    question = key_sampler.draw(q_type, pop)
+    if question is not None:
+        return question
+    if shortage_policy == "substitute":
+        print(f"Ran out of key {q_type} questions, using a regular question.")
+        return (get_question(q_type, pop))
+    if shortage_policy == "fail":
+        raise ValueError(f"Ran out of key {q_type} questions...")
+    print(f"Ran out of key {q_type} questions. Substitute regular questions?")
+    response = input("y/n:")
+    if response.lower() == 'y':
+        return (get_question(q_type, pop))
     else:
-        print(f"Ran out of key {q_type} questions. Substitute regular questions?")
-        response = input("y/n:")
-        if response.lower() == 'y':
-            return (get_question(q_type, pop))
-        else:
-            raise ValueError("Ran out of key questions...")
+        raise ValueError("Ran out of key questions...")
 
 
 def get_question(q_type, pop=True):
@@ -361,19 +513,132 @@ def get_question(q_type, pop=True):
 
     Returns
     -------
-    A question of the given type, and removes it from the pool of questions
+    A question of the given type, and removes it from the pool of questions.
+    Questions are drawn by weight, see gen_samplers.
     """
-    global pool
-    random.shuffle(pool)
-    for question in pool:
-        if question._type == q_type:
-            if pop:
-                pool.remove(question)
-            return question
-    else:
-        print([q.to_string() for q in pool])
+    global pool_sampler
+    question = pool_sampler.draw(q_type, pop)
+    if question is None:
+        if debug:
+            print([q.to_string() for q in pool_sampler.questions()])
         raise ValueError(f"{q_type} not found, are any remaining?")
+    return question
+
+
+def gen_samplers(pool, key_pool, half_life=None):
+    """
+    Builds the samplers questions are drawn from. With a half_life (in days),
+    questions asked recently in past quizzes (see QuizHistory.py) are less
+    likely to be drawn, otherwise every question is equally likely.
+
+    Returns
+    -------
+    pool_sampler, key_sampler : Sampler.WeightedSampler of pool and key_pool
+    """
+    if not half_life:
+        return Sampler.WeightedSampler(pool), Sampler.WeightedSampler(key_pool)
+    history = QuizHistory.load_history()
+    now = datetime.now()
+    samplers = []
+    for questions in (pool, key_pool):
+        weights = [Sampler.staleness_weight(history.last_used(question.question_id()), now, half_life)
+                   for question in questions]
+        samplers.append(Sampler.WeightedSampler(questions, weights))
+    return tuple(samplers)
+    
+
+def build_pools():
+    """
+    Reads the question library and key verses, and makes the pools quizzes
+    are drawn from, with the verse questions, skipped questions and
+    duplicates of quizgen_config.yml.
+
+    Returns
+    -------
+    pool, key_pool : lists of questions
+    """
+    q_lib = readQuestionLibrary()
+    print("Questions file read succesfully")
+    key_verses = readKeyList()
+    print("Key verses file read succesfully")
+    # Debug:
+    if debug:
+        for question in q_lib:
+            print(question.to_string())
+        print("Key verses found:")
+        print(key_verses.to_string())
+    
+    pool, key_pool = gen_pools(q_lib, key_verses)
+    
+    if config.get("GenerateVerseQuestions"):
+        verse_questions = gen_verse_questions(key_verses, key_pool)
+        key_pool.extend(verse_questions)
+        print(f"Generated {len(verse_questions)} QT/FTV questions from the key verses")
+    
+    if config.get("SkipAskedQuestions"):
+        # Leave out questions already asked in a past quiz, or since
+        # SkipAskedSince if it's given (see UsageLedger.py)
+        ledger = UsageLedger.load_ledger()
+        asked = ledger.used_since(config.get("SkipAskedSince"))
+        pool_size = len(pool) + len(key_pool)
+        pool = ledger.exclude(pool, asked)
+        key_pool = ledger.exclude(key_pool, asked)
+        print(f"Left out {pool_size - len(pool) - len(key_pool)} questions asked in past quizzes")
+    
+    if config.get("CollapseDuplicates"):
+        pool, clusters = Dedupe.collapse(pool)
+        key_pool, key_clusters = Dedupe.collapse(key_pool)
+        print(f"Dropped {len(clusters) + len(key_clusters)} groups of near-duplicate questions")
+    return pool, key_pool
+
+
+def draw_quizzes(num_quizzes, seed=None, backups=False, definition=None, reserve_backups=False):
+    """
+    Draws a packet of quizzes from pool_sampler and key_sampler. Every quiz
+    is drawn from its own seed, taken from the packet's seed, so the same
+    seed and pools always give the same packet, and the manifest of an
+    exported packet records how to draw it again.
+
+    Parameters
+    ----------
+    seed : the packet's seed, a random one if None
+    backups : draw a list of backup questions for the packet too, from a
+        BackupReservoir of quiz_definition.yml's Backup Questions
+    definition : the "Questions" section of a quiz, quiz_definition.yml's
+        if not given
+    reserve_backups : give every quiz a BackupReservoir (quiz.backups) to
+        draw backup questions from later
+
+    Returns
+    -------
+    seed, quizzes, backup_questions (None without backups)
+    """
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    seeder = random.Random(seed)
+    quizzes = []
+    for i in range(num_quizzes):
+        quiz_seed = seeder.randrange(1 << 32)
+        random.seed(quiz_seed)
+        if definition is None:
+            quiz = Quiz()
+        else:
+            quiz = Quiz(definition["Number"], definition["RatioKey"],
+                        definition["Distribution"], definition["Default"])
+        quiz.seed = quiz_seed
+        if reserve_backups:
+            quiz.backups = BackupReservoir(quiz.question_set, pool_sampler, key_sampler)
+        quizzes.append(quiz)
     
+    backup_questions = None
+    if backups:
+        quiz_seed = seeder.randrange(1 << 32)
+        random.seed(quiz_seed)
+        asked = [question for quiz in quizzes for question in quiz.question_set]
+        reservoir = BackupReservoir(asked, pool_sampler, key_sampler)
+        backup_questions = Quiz.from_questions(reservoir.draw_all(), quiz_seed)
+    return seed, quizzes, backup_questions
+
 
 def string_to_html(text, title="Quiz"):
     """
@@ -408,14 +673,100 @@ def get_timestamp():
 
 
 # Main =======================================================================
-def main():
+def parse_arguments(argv=None):
+    """
+    Reads the command line. Anything given replaces its setting from
+    quizgen_config.yml.
+    """
+    parser = argparse.ArgumentParser(prog="QuizGen",
+                                     description="Generates quizzes from a question library and key verses.",
+                                     epilog="With no options, runs interactively with the settings in quizgen_config.yml")
+    parser.add_argument("--batch", action="store_true",
+                        help="Don't wait for Enter or ask anything, for scripted runs")
+    parser.add_argument("--questions",
+                        help="Question library .csv")
+    parser.add_argument("--book",
+                        help="Book of every question, if the questions .csv has no Book column")
+    parser.add_argument("--key-verses",
+                        help="Key verses .csv")
+    parser.add_argument("--output",
+                        help="Directory to write the quizzes to")
+    parser.add_argument("--count", type=int,
+                        help="Number of quizzes to generate")
+    parser.add_argument("--seed", type=int,
+                        help="Seed to draw the quizzes from, to draw the same quizzes again")
+    parser.add_argument("--title",
+                        help='Title of the quizzes, "#N" is added to each')
+    parser.add_argument("--meet",
+                        help='Only draw from the chapters of this meet in meet_schedule.yml, or "all" for every meet')
+    parser.add_argument("--format", choices=Export.formats,
+                        help="files: one .html per quiz, zip or html: the whole packet in one file")
+    parser.add_argument("--on-shortage", choices=shortage_policies,
+                        help="When key questions of a type run out: ask (the default, or fail with --batch), "
+                             "substitute regular questions, or fail")
+    parser.add_argument("--console", action="store_true",
+                        help="After writing the quizzes, draw backup questions for them one at a time as they are needed")
+    parser.add_argument("--debug", action="store_true",
+                        help="Print the library and key verses as they are read")
+    options = parser.parse_args(argv)
+    # --batch runs can't wait for an answer
+    if options.batch and options.on_shortage == "ask":
+        parser.error("--on-shortage ask can't be used with --batch")
+    if options.batch and options.console:
+        parser.error("--console can't be used with --batch")
+    return options
+
+
+def apply_arguments(options):
+    """
+    Puts the command line options into config.
+    """
+    global shortage_policy
+    overrides = {("Paths", "QuestionsCSV"): options.questions,
+                 ("Paths", "QuestionsBook"): options.book,
+                 ("Paths", "KeyVersesCSV"): options.key_verses,
+                 ("Paths", "ResultsDirectory"): options.output,
+                 ("NumberToGenerate",): options.count,
+                 ("Seed",): options.seed,
+                 ("Titles",): options.title,
+                 ("ExportFormat",): options.format,
+                 ("Meet",): options.meet}
+    for keys, value in overrides.items():
+        if value is None:
+            continue
+        section = config
+        for key in keys[:-1]:
+            section = section.setdefault(key, {})
+        section[keys[-1]] = value
+    shortage_policy = options.on_shortage or ("fail" if options.batch else "ask")
+
+
+def main(argv=None):
+    """
+    Returns 0 once the quizzes are written, 1 if they couldn't be made (or
+    input ran out while asking something).
+    """
+    options = parse_arguments(argv)
+    apply_arguments(options)
+    try:
+        generate(interactive=not options.batch, debug_mode=options.debug, console=options.console)
+    except (AssertionError, ValueError, KeyError, OSError) as error:
+        print(f"QuizGen: error: {error}", file=sys.stderr)
+        return 1
+    except EOFError:
+        print("QuizGen: error: input ended before every question was answered", file=sys.stderr)
+        return 1
+    return 0
+
+
+def generate(interactive=True, debug_mode=False, console=False):
     # General flow:
     # Welcome screen
     # Configure settings, paths, ratios
     # Choose output type (print, txt, location)
     # Crunch numbers
     global debug
-    debug = False
+    debug = debug_mode
     print("""
           ====================================================================
           
@@ -426,31 +777,17 @@ def main():
           ====================================================================
           """)
     # type 'debug' to enter debug mode
-    resp = input("Press Enter to continue")
-    if resp == 'debug':
-        debug = True
-    else:
-        debug = False
+    if interactive:
+        resp = input("Press Enter to continue")
+        if resp == 'debug':
+            debug = True
 
-    q_lib = readQuestionLibrary()
-    print("Questions file read succesfully")
-    key_verses = readKeyList()
-    print("Key verses file read succesfully")
     result_path = config["Paths"]["ResultsDirectory"]
     
     global pool
     global key_pool
+    pool, key_pool = build_pools()
     
-    # Debug:
-    if debug:
-        for question in q_lib:
-            print(question)
-        print("Key verses found:")
-        for ref in key_verses:
-            print(ref.to_string())
-    
-    pool, key_pool = gen_pools(q_lib, key_verses)
-        
     # set params
     num_quizzes = config["NumberToGenerate"]
     if not num_quizzes:
@@ -458,23 +795,102 @@ def main():
     
     desired_title = config["Titles"]
     
-    # crunch numbers
-    quizzes = []
-    for i in range(num_quizzes):
-        quizzes.append(Quiz())
+    export_format = config.get("ExportFormat") or "files"
+    assert export_format in Export.formats, f"ExportFormat must be one of {Export.formats}"
+    
+    # With the backup console, backups are drawn from a reservoir for each
+    # quiz when they are needed, instead of a list for the packet
+    backups = quiz_definition["Backup Questions"]["Enabled"] and not console
+    
+    # Only draw from the chapters each meet covers (see MeetSchedule.py),
+    # with one index of the pools for every meet
+    meet = config.get("Meet")
+    if not meet:
+        packets = [(desired_title, pool, key_pool)]
+    else:
+        schedule = MeetSchedule.load_schedule()
+        meets = list(schedule) if meet == "all" else [meet]
+        for name in meets:
+            assert name in schedule, f"{name} isn't in meet_schedule.yml"
+        index = MeetSchedule.VerseIndex(pool)
+        key_index = MeetSchedule.VerseIndex(key_pool)
+        packets = [(f"{desired_title} {name}", index.select(schedule[name]), key_index.select(schedule[name]))
+                   for name in meets]
+    
+    global pool_sampler
+    global key_sampler
+    drawn = []
+    for title, packet_pool, packet_key_pool in packets:
+        if meet:
+            print(f"{title}: {len(packet_pool)} questions and {len(packet_key_pool)} key questions")
+        pool_sampler, key_sampler = gen_samplers(packet_pool, packet_key_pool, config.get("StalenessHalfLife"))
+        # crunch numbers
+        seed, quizzes, backup_questions = draw_quizzes(num_quizzes, config.get("Seed"), backups,
+                                                       reserve_backups=console)
+        write_packet(title, seed, quizzes, backup_questions, result_path, export_format)
+        drawn.extend((f"{title} #{index}", quiz) for index, quiz in enumerate(quizzes, start=1))
+    
+    if console:
+        backup_console(drawn)
+
+
+def backup_console(entries):
+    """
+    Draws backup questions while the quizzes are being run. Each line is a
+    quiz number (in the order of entries) and optionally a question type,
+    i.e. "2 MA", and prints a backup for that quiz.
     
-    # if desired, generate backup question set
-    if (quiz_definition["Backup Questions"]["Enabled"]):
-        backup_questions = Quiz(quiz_definition["Backup Questions"]["Number"],
-                      quiz_definition["Backup Questions"]["RatioKey"],
-                      quiz_definition["Backup Questions"]["Distribution"])
+    entries : a list of (title, Quiz), every Quiz with a BackupReservoir
+    """
+    print("Backup questions: enter a quiz number and a question type (i.e. 2 MA), or nothing to stop.")
+    for number, (title, quiz) in enumerate(entries, start=1):
+        print(f"    {number}. {title}")
+    while True:
+        request = input("backup> ").split()
+        if not request:
+            return
+        if not request[0].isdigit() or not 1 <= int(request[0]) <= len(entries):
+            print(f"Quiz number should be 1 to {len(entries)}")
+            continue
+        title, quiz = entries[int(request[0]) - 1]
+        qtype = request[1].upper() if len(request) > 1 else None
+        question = quiz.backups.draw(qtype)
+        if question is None:
+            print(f"No {qtype + ' ' if qtype else ''}backups left for {title}")
+            continue
+        print(f"{title} backup ({quiz.backups.remaining()} left):")
+        print(f"{question.reference()}\n {question._type}\n {question.prompt}\n {question.answer}")
+
+
+def write_packet(desired_title, seed, quizzes, backup_questions, result_path, export_format):
+    """
+    Writes a packet of quizzes to result_path in export_format, or prints it
+    if there is no result_path.
+    """
+    if result_path and export_format != "files":
+        # The whole packet goes in one file
+        entries = [(f"{desired_title} #{index}", quiz) for index, quiz in enumerate(quizzes, start=1)]
+        if backup_questions is not None:
+            entries.append((f"{desired_title} Backups", backup_questions))
+        manifest = Export.packet_manifest(desired_title, seed, entries)
+        if export_format == "zip":
+            documents = [(title, string_to_html(quiz.to_string(), title=title)) for title, quiz in entries]
+            packet_path = os.path.join(result_path, f"{desired_title}.zip")
+            Export.export_zip(packet_path, documents, manifest)
+        else:
+            sections = [(title, quiz.to_string().replace('\n', "<br>")) for title, quiz in entries]
+            packet_path = os.path.join(result_path, f"{desired_title}.html")
+            Export.export_html(packet_path, desired_title, sections, manifest, get_timestamp())
+        print(f"{len(entries)} quizzes written to {packet_path}")
+        return
     
     # spit out results
     for index, quiz in enumerate(quizzes):
         index = index + 1
         if not result_path:
             # TODO implement titles later, console output only
-            print(quiz.to_string(f"{desired_title} #{index}"))
+            print(f"{desired_title} #{index}")
+            print(quiz.to_string())
         else:
             text = quiz.to_string()
             html = string_to_html(text, title=f"{desired_title} #{index}")
@@ -483,11 +899,15 @@ def main():
                 file.write(html)
     
     # Now write backup questions if enabled
-    if (quiz_definition["Backup Questions"]["Enabled"]):
+    if backup_questions is not None and not result_path:
+        print(f"{desired_title} Backups")
+        print(backup_questions.to_string())
+    elif backup_questions is not None:
         text = backup_questions.to_string()
         html = string_to_html(text, title=f"{desired_title} Backups")
         with open(f"{result_path}/{desired_title} Backups.html", 'x') as file:
             file.write(html)
         
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
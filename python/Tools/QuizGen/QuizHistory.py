@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Reads back the quizzes that have been used (the .txt quiz nights in
+    resources/Hebrews/quizzes, and the .html quizzes QuizGen writes to the
+    results directory) and keeps a history of which questions were asked, and
+    when, so generation can know what has been asked already.
+
+    Both formats are the "N. Book ch:v / TYPE / prompt / answer" layout of
+    Quiz.to_string. Each file is read a line at a time, and each question is
+    matched to the library by its id (see QuestionStore.question_id), a hash
+    of its reference, type and prompt words, so small differences in case,
+    punctuation or spacing don't matter.
+
+    A quiz's date is the timestamp QuizGen writes in an .html quiz, or a
+    date in the file name or title (2024-03-14 or 3/14/2024). A file's
+    modification time isn't used, since copying or checking out a file
+    changes it. Quizzes with no date are kept with a date of None, unknown.
+
+    The history is saved to resources/quiz_history.json, and a file is only
+    parsed again when it has changed.
+"""
+# Imports ====================================================================
+import argparse
+import glob
+import html
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+absolute_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(absolute_path, "../Common"))
+
+import References  # noqa: E402
+import QuestionStore  # noqa: E402
+
+# Constants ==================================================================
+resources_path = os.path.join(absolute_path, "../../../resources/")
+default_history_path = os.path.join(resources_path, "quiz_history.json")
+default_quiz_paths = [
+    os.path.join(resources_path, "Hebrews/quizzes"),
+    os.path.join(absolute_path, "../../../results"),
+]
+quiz_extensions = (".txt", ".html")
+
+VERSION = 3
+
+# "12. 1 Thessalonians 2:15-16", the first line of every question
+_entry_pattern = re.compile(r"\s*(\d+)\.\s+(.+?)\s+(\d[\d:,;\s\-–—]*?)\s*")
+_title_pattern = re.compile(r"<h1>(.*?)</h1>", re.IGNORECASE | re.DOTALL)
+_timestamp_pattern = re.compile(r"<h3>\s*(\d\d/\d\d/\d{4} \d\d:\d\d:\d\d)\s*</h3>", re.IGNORECASE)
+_break_pattern = re.compile(r"<br\s*/?>|</?(?:p|div|section|li|ol|h\d)[^>]*>", re.IGNORECASE)
+_tag_pattern = re.compile(r"<[^>]*>")
+# Dates in a file name or title, i.e. "2024-03-14" or "3/14/2024"
+_iso_date_pattern = re.compile(r"(?<!\d)(\d{4})-(\d{1,2})-(\d{1,2})(?!\d)")
+_us_date_pattern = re.compile(r"(?<!\d)(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})(?!\d)")
+_question_start_pattern = re.compile(r"^\s*\d+\.\s", re.MULTILINE)
+
+
+# Function definitions =======================================================
+def read_text(path):
+    """
+    Returns a file's text. Some quiz nights were saved as Windows-1252
+    (curly quotes), so that is tried if it isn't utf-8.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+
+def date_in(text):
+    """
+    Returns the first date written in text, i.e. "Quiz Night 2024-03-14" or
+    "Meet 3 (3/14/2024)", as a datetime, or None if there isn't one.
+    """
+    found = []
+    match = _iso_date_pattern.search(text)
+    if match:
+        year, month, day = map(int, match.groups())
+        found.append((match.start(), year, month, day))
+    match = _us_date_pattern.search(text)
+    if match:
+        month, day, year = map(int, match.groups())
+        found.append((match.start(), year, month, day))
+    for _, year, month, day in sorted(found):
+        try:
+            return datetime(year, month, day)
+        except ValueError:
+            continue
+    return None
+
+
+def html_lines(text):
+    """
+    Yields the lines of a QuizGen .html quiz as plain text, with every
+    <h1> title on a line of its own starting with "# ".
+    """
+    text = _title_pattern.sub(lambda match: "\n# " + _tag_pattern.sub("", match.group(1)) + "\n", text)
+    text = re.sub(r"<script.*?</script>", "", text, flags=re.IGNORECASE | re.DOTALL)
+    text = _tag_pattern.sub("", _break_pattern.sub("\n", text))
+    for line in text.split("\n"):
+        yield html.unescape(line)
+
+
+def parse_reference_line(line):
+    """
+    Returns (number, verse ids) if line starts a question, i.e.
+    "3. Hebrews 11:37", otherwise None.
+    """
+    match = _entry_pattern.fullmatch(line)
+    if not match:
+        return None
+    try:
+        return int(match.group(1)), References.parse(match.group(2), match.group(3))
+    except (KeyError, ValueError):
+        return None
+
+
+def parse_quiz_lines(lines, title=""):
+    """
+    Yields (quiz title, number, verse ids, type, prompt, answer) for every
+    question in the lines of a quiz file. Lines after the answer (an answer
+    that ran onto a second line) are added to the answer.
+
+    A "# title" line, or numbering starting over (the backup questions),
+    starts a new quiz.
+    """
+    part = 0
+    last_number = 0
+    current = None
+    for line in lines:
+        line = line.rstrip("\r")
+        if line.startswith("# "):
+            if current:
+                yield current_entry(current)
+                current = None
+            title = line[2:].strip()
+            part = 0
+            last_number = 0
+            continue
+        found = parse_reference_line(line)
+        if found is not None:
+            if current:
+                yield current_entry(current)
+            number, vids = found
+            if number <= last_number:
+                part += 1
+            last_number = number
+            quiz_title = f"{title} (part {part + 1})" if part else title
+            current = [quiz_title, number, vids, []]
+        elif current is not None:
+            if line.strip() and not line.startswith("-----"):
+                current[3].append(line.strip())
+    if current:
+        yield current_entry(current)
+
+
+def current_entry(current):
+    quiz_title, number, vids, lines = current
+    _type = lines[0] if lines else ""
+    prompt = lines[1] if len(lines) > 1 else ""
+    answer = " ".join(lines[2:])
+    return quiz_title, number, vids, _type, prompt, answer
+
+
+def parse_quiz_file(path):
+    """
+    Returns (date, entries) of a .txt or .html quiz, where date is when the
+    quiz was written as an ISO string, or None if the file doesn't say (see
+    the top of this file), and entries are as from parse_quiz_lines.
+    """
+    text = read_text(path)
+    title = os.path.splitext(os.path.basename(path))[0]
+    if path.lower().endswith(".html"):
+        match = _timestamp_pattern.search(text)
+        if match:
+            date = datetime.strptime(match.group(1), "%m/%d/%Y %H:%M:%S")
+        else:
+            date = date_in(title) or date_in(" ".join(_title_pattern.findall(text)))
+        entries = list(parse_quiz_lines(html_lines(text), title))
+    else:
+        first_question = _question_start_pattern.search(text)
+        date = date_in(title) or date_in(text[:first_question.start() if first_question else len(text)])
+        entries = list(parse_quiz_lines(text.split("\n"), title))
+    return (date.isoformat(timespec="seconds") if date else None), entries
+
+
+def quiz_files(paths):
+    """
+    Returns every quiz file in a list of files, directories and globs, sorted.
+    """
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [os.path.join(path, name) for name in os.listdir(path)]
+        else:
+            candidates = glob.glob(path)
+        found.update(os.path.normpath(candidate) for candidate in candidates
+                     if candidate.lower().endswith(quiz_extensions) and os.path.isfile(candidate))
+    return sorted(found)
+
+
+# Class definitions ==========================================================
+class UsageHistory:
+    """
+    Which questions have been asked, in which quiz, and when.
+
+    sources : {file path: {"mtime", "date",
+               "quizzes": {quiz title: [question id, ...]},
+               "verses": {question id: [verse id, ...]}}}
+    """
+
+    def __init__(self, history_path=default_history_path):
+        self.history_path = history_path
+        self.sources = {}
+        if history_path and os.path.exists(history_path):
+            with open(history_path, 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+            if saved.get("version") == VERSION:
+                self.sources = saved["sources"]
+        self._uses = None
+
+    def save(self):
+        temp_path = self.history_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({"version": VERSION, "sources": self.sources}, file)
+        os.replace(temp_path, self.history_path)
+
+    def update(self, paths=None):
+        """
+        Parses every quiz file in paths (default_quiz_paths if not given)
+        that is new or has changed, and forgets files that are gone.
+
+        Returns
+        -------
+        The number of files parsed
+        """
+        files = quiz_files(default_quiz_paths if paths is None else paths)
+        parsed = 0
+        for path in files:
+            mtime = os.path.getmtime(path)
+            source = self.sources.get(path)
+            if source is not None and source["mtime"] == mtime:
+                continue
+            date, entries = parse_quiz_file(path)
+            quizzes = {}
+            verses = {}
+            for quiz_title, number, vids, _type, prompt, answer in entries:
+                qid = QuestionStore.question_id(vids, _type, prompt)
+                quizzes.setdefault(quiz_title, []).append(qid)
+                verses[qid] = list(vids)
+            self.sources[path] = {"mtime": mtime, "date": date, "quizzes": quizzes, "verses": verses}
+            parsed += 1
+        for path in set(self.sources) - set(files):
+            del self.sources[path]
+        self._uses = None
+        return parsed
+
+    def uses(self, question_id=None):
+        """
+        Returns [(date, file path, quiz title)] of every time a question was
+        asked, oldest first, with uses of unknown date (None) before the
+        rest. Without a question id, returns the dict of {question id: uses}
+        for every question.
+        """
+        if self._uses is None:
+            self._uses = {}
+            for path, source in self.sources.items():
+                for quiz_title, ids in source["quizzes"].items():
+                    for qid in ids:
+                        self._uses.setdefault(qid, []).append((source["date"], path, quiz_title))
+            for found in self._uses.values():
+                found.sort(key=lambda use: (use[0] or "", use[1], use[2]))
+        if question_id is None:
+            return self._uses
+        return self._uses.get(question_id, [])
+
+    def verses(self, question_id):
+        """
+        Returns the verse ids of a question that has been asked.
+        """
+        for source in self.sources.values():
+            if question_id in source["verses"]:
+                return source["verses"][question_id]
+        return []
+
+    def times_used(self, question_id):
+        return len(self.uses(question_id))
+
+    def last_used(self, question_id):
+        """
+        Returns the date a question was last asked, as an ISO string, or None
+        if it never has been or no use of it has a known date.
+        """
+        found = self.uses(question_id)
+        return found[-1][0] if found else None
+
+    def used_ids(self):
+        return set(self.uses())
+
+
+def load_history(paths=None, history_path=default_history_path):
+    """
+    Returns the UsageHistory, brought up to date with the quiz files (and
+    saved, if anything changed).
+    """
+    history = UsageHistory(history_path)
+    if history.update(paths):
+        history.save()
+    return history
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="QuizHistory",
+                                     description="Reads past quizzes and reports which questions have been asked.")
+    parser.add_argument("paths", nargs='*',
+                        help="Quiz files or directories (defaults to the Hebrews quizzes and the results directory)")
+    parser.add_argument("--history", default=default_history_path,
+                        help="Where the history is saved")
+    parser.add_argument("--library",
+                        help="A question .csv to match the asked questions against")
+    parser.add_argument("--book",
+                        help="Book to use if the library has no Book column")
+    options = parser.parse_args()
+
+    history = UsageHistory(options.history)
+    parsed = history.update(options.paths or None)
+    if parsed:
+        history.save()
+    uses = history.uses()
+    total = sum(len(found) for found in uses.values())
+    print(f"{len(history.sources)} quiz files ({parsed} read), {total} questions asked, "
+          f"{len(uses)} different questions.")
+
+    if options.library:
+        store = QuestionStore.QuestionStore.from_csv(options.library, options.book)
+        library_ids = {view.question_id() for view in store}
+        asked = library_ids & set(uses)
+        print(f"{len(asked)} of {len(library_ids)} library questions have been asked, "
+              f"{len(set(uses) - library_ids)} asked questions aren't in the library.")
+
+    repeated = sorted(((len(found), qid) for qid, found in uses.items() if len(found) > 1), reverse=True)
+    for count, qid in repeated[:10]:
+        last = uses[qid][-1]
+        print(f"    {qid} asked {count} times, last in {last[2]} ({last[0] or 'date unknown'})")
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Keeps QuizGen's pools in memory and serves quizzes over a small local
+    HTTP/JSON interface, so a quizmaster (or a page on the scoring laptop)
+    can ask for a quiz in a few milliseconds, instead of QuizGen reading the
+    library, key verses and history again for every packet.
+
+    The library is read, and the pools and samplers built, once at startup
+    (see QuizGen_V2.build_pools and gen_samplers). Each request draws from its
+    own copy-on-write view of the samplers (see Sampler.WeightedSampler.view),
+    so requests never see each other's draws and the warm pools are never
+    changed. A request can name a room instead: the room keeps its view
+    between requests, so the quizzes of one room don't repeat questions.
+    A request can also name a meet of meet_schedule.yml, to only draw from
+    the chapters it covers (see MeetSchedule.py). At most max_rooms rooms
+    are kept; past that, the room that drew least recently is forgotten.
+
+    Requests:
+        GET    /health        the number of questions in the pools
+        POST   /quiz          draws quizzes, see draw
+        POST   /backup        draws a backup question for a quiz of a room
+        DELETE /rooms/<name>  forgets what a room has drawn
+
+    POST /quiz takes a json object, every part of it optional:
+        {"seed": 1234, "count": 1, "backups": false, "room": "A", "meet": "Meet 3",
+         "on_shortage": "substitute",
+         "definition": {"Number": 20, "RatioKey": 0.5, "Default": "INT",
+                        "Distribution": {"QT": "1,2", ...}}}
+    and the same seed (without a room) gives the same packet as
+    QuizGen_V2.py --seed with the same settings.
+
+    Quizzes drawn for a room each get a BackupReservoir, so a backup can be
+    drawn for one when a question is thrown out, with
+        {"room": "A", "quiz": <the quiz's seed>, "type": "MA"}
+    ("type" and "meet" are optional, and "type" is one of
+    question_types.yml's). Backups come out of the room's pools,
+    and are never a question already in the quiz.
+
+Usage:
+    python QuizService.py --port 8765
+"""
+# Imports ====================================================================
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../Common"))
+import Export  # noqa: E402
+import MeetSchedule  # noqa: E402
+import QuizGen_V2  # noqa: E402
+
+# Constants ==================================================================
+default_host = "127.0.0.1"
+default_port = 8765
+max_body = 1 << 20   # bytes, no quiz definition is anywhere near this
+max_rooms = 64       # rooms kept at once, a meet has a handful
+
+_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+# Class definitions ==========================================================
+class QuizService:
+    """
+    The warm pools and samplers, and the rooms drawing from them.
+    """
+
+    def __init__(self, pool, key_pool, half_life=None, room_limit=max_rooms):
+        self.pool = pool
+        self.key_pool = key_pool
+        self.half_life = half_life
+        self.samplers = {None: QuizGen_V2.gen_samplers(pool, key_pool, half_life)}
+        self.schedule = None
+        self.indexes = None
+        self.rooms = {}  # least recently used first
+        self.room_limit = room_limit
+
+    def meet_samplers(self, meet=None):
+        """
+        Returns (pool sampler, key sampler) of a meet's chapters, or of the
+        whole library if meet is None. Every meet is cut from one index of
+        the pools, made the first time a meet is asked for.
+        """
+        if meet not in self.samplers:
+            if self.indexes is None:
+                self.schedule = MeetSchedule.load_schedule()
+                self.indexes = (MeetSchedule.VerseIndex(self.pool), MeetSchedule.VerseIndex(self.key_pool))
+            assert meet in self.schedule, f"{meet} isn't in meet_schedule.yml"
+            index, key_index = self.indexes
+            self.samplers[meet] = QuizGen_V2.gen_samplers(index.select(self.schedule[meet]),
+                                                          key_index.select(self.schedule[meet]), self.half_life)
+        return self.samplers[meet]
+
+    def views(self, room=None, meet=None):
+        """
+        Returns (pool view, key view) to draw a request from: views of the
+        room's samplers if the request names a room that has drawn before,
+        otherwise of the meet's. Nothing drawn from them is kept until
+        keep_room is called.
+        """
+        if (room, meet) in self.rooms:
+            pool_sampler, key_sampler = self.use_room((room, meet))[:2]
+        else:
+            pool_sampler, key_sampler = self.meet_samplers(meet)
+        return pool_sampler.view(), key_sampler.view()
+
+    def keep_room(self, room, meet, pool_view, key_view, quizzes):
+        """
+        Keeps what a successful request drew for a room (from views), and
+        the backup reservoirs of its quizzes.
+        """
+        if (room, meet) not in self.rooms:
+            self.rooms[(room, meet)] = (pool_view, key_view, {})
+        else:
+            pool_sampler, key_sampler, _ = self.rooms[(room, meet)]
+            pool_sampler.commit(pool_view)
+            key_sampler.commit(key_view)
+            for quiz in quizzes:
+                quiz.backups.pool_sampler, quiz.backups.key_sampler = pool_sampler, key_sampler
+        self.rooms[(room, meet)][2].update((quiz.seed, quiz.backups) for quiz in quizzes)
+        while len(self.rooms) > self.room_limit:
+            del self.rooms[next(iter(self.rooms))]
+
+    def use_room(self, key):
+        """
+        Returns a room, moved to the end of self.rooms as the most recently
+        used.
+        """
+        self.rooms[key] = self.rooms.pop(key)
+        return self.rooms[key]
+
+    def draw(self, request):
+        """
+        Draws the quizzes of a POST /quiz request.
+
+        Returns
+        -------
+        {"seed", "quizzes": [{"title", "seed", "questions", "text"}]}
+        """
+        seed = request.get("seed")
+        count = request.get("count", 1)
+        on_shortage = request.get("on_shortage", "fail")
+        definition = request.get("definition")
+        assert seed is None or isinstance(seed, int), "seed must be a whole number"
+        assert isinstance(count, int) and count >= 1, "count must be at least 1"
+        assert on_shortage in ("substitute", "fail"), 'on_shortage must be "substitute" or "fail"'
+        if definition is not None:
+            definition = check_definition(definition)
+
+        # Nothing below awaits, so no other request can run while the
+        # module's samplers are this request's views
+        room, meet = request.get("room"), request.get("meet")
+        pool_view, key_view = self.views(room, meet)
+        QuizGen_V2.pool_sampler, QuizGen_V2.key_sampler = pool_view, key_view
+        QuizGen_V2.shortage_policy = on_shortage
+        seed, quizzes, backup_questions = QuizGen_V2.draw_quizzes(count, seed, bool(request.get("backups")),
+                                                                  definition, reserve_backups=room is not None)
+        if room is not None:
+            self.keep_room(room, meet, pool_view, key_view, quizzes)
+
+        title = request.get("title") or QuizGen_V2.config["Titles"]
+        entries = [(f"{title} #{index}", quiz) for index, quiz in enumerate(quizzes, start=1)]
+        if backup_questions is not None:
+            entries.append((f"{title} Backups", backup_questions))
+        manifest = Export.packet_manifest(title, seed, entries)
+        for entry, (_, quiz) in zip(manifest["quizzes"], entries):
+            for question_entry, question in zip(entry["questions"], quiz.question_set):
+                question_entry["prompt"] = question.prompt
+                question_entry["answer"] = question.answer
+            entry["text"] = quiz.to_string()
+        return manifest
+
+    def draw_backup(self, request):
+        """
+        Draws a backup question for a quiz drawn for a room, see the top of
+        this file.
+        """
+        key = (request.get("room"), request.get("meet"))
+        assert key in self.rooms, "no quizzes have been drawn for that room"
+        reservoirs = self.use_room(key)[2]
+        assert request.get("quiz") in reservoirs, "no quiz with that seed has been drawn for that room"
+        reservoir = reservoirs[request["quiz"]]
+        assert isinstance(request.get("type") or "", str), "type must be a question type"
+        qtype = (request.get("type") or "").upper() or None
+        assert qtype is None or qtype in QuizGen_V2.question_types["Question Types"], \
+            f"Unknown question type {qtype}"
+        question = reservoir.draw(qtype)
+        if question is None:
+            return {"question": None, "remaining": reservoir.remaining()}
+        return {"question": {"id": question.question_id(), "reference": question.reference(),
+                             "type": question._type, "prompt": question.prompt, "answer": question.answer},
+                "remaining": reservoir.remaining()}
+
+    def health(self):
+        return {"questions": len(self.pool), "key_questions": len(self.key_pool), "rooms": len(self.rooms)}
+
+    def respond(self, method, path, body):
+        """
+        Returns (status, json object) for a request.
+        """
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            return 200, self.health()
+        if path in ("/quiz", "/backup"):
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                request = json.loads(body or b"{}")
+                assert isinstance(request, dict), "the request must be a json object"
+                if path == "/backup":
+                    return 200, self.draw_backup(request)
+                return 200, self.draw(request)
+            except (AssertionError, ValueError, KeyError, TypeError) as error:
+                return 400, {"error": str(error)}
+        if path.startswith("/rooms/"):
+            if method != "DELETE":
+                return 405, {"error": "use DELETE"}
+            room = path[len("/rooms/"):]
+            forgotten = [key for key in self.rooms if key[0] == room]
+            for key in forgotten:
+                del self.rooms[key]
+            return 200, {"forgotten": bool(forgotten)}
+        return 404, {"error": f"no such path {path}"}
+
+    async def handle(self, reader, writer):
+        """
+        Answers one HTTP request on a connection, then closes it.
+        """
+        try:
+            status, reply = await self.read_and_respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as error:
+            status, reply = 500, {"error": str(error)}
+        data = json.dumps(reply).encode("utf8")
+        writer.write(f"HTTP/1.1 {status} {_reasons[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def read_and_respond(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return 400, {"error": "bad request line"}
+        method, path, _ = request_line
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                if not value.strip().isdecimal():
+                    return 400, {"error": "bad Content-Length"}
+                length = int(value)
+        if length > max_body:
+            return 413, {"error": "request too large"}
+        body = await reader.readexactly(length) if length else b""
+        return self.respond(method.upper(), path.split("?")[0], body)
+
+
+# Function definitions =======================================================
+def check_definition(definition):
+    """
+    Returns the "definition" of a request laid over quiz_definition.yml's,
+    checked and tidied up the same way (see QuizGen_V2.validate_quiz_definition).
+    """
+    assert isinstance(definition, dict), "definition must be an object"
+    merged = {**copy.deepcopy(QuizGen_V2.quiz_definition["Quiz"]["Questions"]), **copy.deepcopy(definition)}
+    assert isinstance(merged["Distribution"], dict), "Distribution must be an object"
+    merged = QuizGen_V2.validate_quiz_definition({"Quiz": {"Questions": merged}})["Quiz"]["Questions"]
+    known = QuizGen_V2.question_types["Question Types"]
+    for _type in merged["Distribution"]:
+        assert _type in known, f"Unknown question type {_type}"
+    assert merged["Default"] in known, f"Unknown question type {merged['Default']}"
+    return merged
+
+
+def load_service():
+    """
+    Builds the pools from the settings in quizgen_config.yml.
+    """
+    pool, key_pool = QuizGen_V2.build_pools()
+    return QuizService(pool, key_pool, QuizGen_V2.config.get("StalenessHalfLife"))
+
+
+async def serve(service, host=default_host, port=default_port):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving quizzes on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="QuizService",
+                                     description="Keeps the question pools in memory and serves quizzes over HTTP.")
+    parser.add_argument("--host", default=default_host,
+                        help="Address to listen on (only this computer by default)")
+    parser.add_argument("--port", type=int, default=default_port,
+                        help="Port to listen on")
+    parser.add_argument("--questions",
+                        help="Question library .csv")
+    parser.add_argument("--book",
+                        help="Book of every question, if the questions .csv has no Book column")
+    parser.add_argument("--key-verses",
+                        help="Key verses .csv")
+    options = parser.parse_args()
+    if options.questions:
+        QuizGen_V2.config["Paths"]["QuestionsCSV"] = options.questions
+    if options.book:
+        QuizGen_V2.config["Paths"]["QuestionsBook"] = options.book
+    if options.key_verses:
+        QuizGen_V2.config["Paths"]["KeyVersesCSV"] = options.key_verses
+
+    start = time.perf_counter()
+    service = load_service()
+    print(f"{len(service.pool)} questions and {len(service.key_pool)} key questions ready "
+          f"in {time.perf_counter() - start:.1f}s")
+    try:
+        asyncio.run(serve(service, options.host, options.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Draws questions for a quiz without replacement, where each question is
+    as likely to be drawn as its weight. Weights come from how recently the
+    question was last asked (see QuizHistory.py): questions asked last week
+    are unlikely to come up again, questions never asked are the most likely,
+    and the rest recover over the season.
+
+    Each question type has its own Fenwick (binary indexed) tree of weights,
+    so a draw, and taking the drawn question out, are O(log n), instead of
+    shuffling the whole pool for every question.
+"""
+# Imports ====================================================================
+import random
+from datetime import datetime
+
+# Constants ==================================================================
+HALF_LIFE = 28      # days for a used question to get back half its weight
+MIN_WEIGHT = 0.05   # weight of a question asked today, so it can still come up
+
+
+# Function definitions =======================================================
+def staleness_weight(last_used, now=None, half_life=HALF_LIFE, minimum=MIN_WEIGHT):
+    """
+    Parameters
+    ----------
+    last_used : when the question was last asked, as an ISO string or
+        datetime, or None if it never has been or the date isn't known
+        (nothing says it was asked recently)
+    half_life : days for the weight to get halfway back to 1
+
+    Returns
+    -------
+    weight : from minimum (asked just now) up to 1 (never asked)
+    """
+    if last_used is None or not half_life:
+        return 1.0
+    if isinstance(last_used, str):
+        last_used = datetime.fromisoformat(last_used)
+    now = now or datetime.now()
+    days = max(0.0, (now - last_used).total_seconds() / 86400)
+    return max(minimum, 1 - 0.5 ** (days / half_life))
+
+
+# Class definitions ==========================================================
+class FenwickTree:
+    """
+    Prefix sums of a list of weights, with O(log n) updates and O(log n)
+    "which item does this running total land in" searches.
+    """
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.weights = [float(weight) for weight in weights]
+        tree = [0.0] + self.weights
+        for index in range(1, self.size + 1):
+            parent = index + (index & -index)
+            if parent <= self.size:
+                tree[parent] += tree[index]
+        self.tree = tree
+        self.step = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def add(self, index, delta):
+        self.weights[index] += delta
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def set(self, index, weight):
+        self.add(index, weight - self.weights[index])
+
+    def total(self):
+        total = 0.0
+        index = self.size
+        while index:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, target):
+        """
+        Returns the index of the item whose share of the running total
+        contains target (0 <= target < total).
+        """
+        position = 0
+        step = self.step
+        while step:
+            following = position + step
+            if following <= self.size and self.tree[following] <= target:
+                position = following
+                target -= self.tree[following]
+            step >>= 1
+        return position
+
+
+class FenwickOverlay(FenwickTree):
+    """
+    A copy-on-write view of a FenwickTree: reads fall through to the base
+    tree until a weight is changed, and changes only touch the view, so many
+    views can draw from one tree without copying it or seeing each other.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.size = base.size
+        self.step = base.step
+        self.weights = _Overlay(base.weights)
+        self.tree = _Overlay(base.tree)
+
+    def commit(self):
+        """
+        Writes the view's changes into its base tree, and starts over.
+        """
+        for overlay, base in ((self.weights, self.base.weights), (self.tree, self.base.tree)):
+            for index, value in overlay.changed.items():
+                base[index] = value
+            overlay.changed.clear()
+
+
+class _Overlay:
+    """
+    A list that reads from base until an item is set.
+    """
+
+    __slots__ = ("base", "changed")
+
+    def __init__(self, base):
+        self.base = base
+        self.changed = {}
+
+    def __getitem__(self, index):
+        changed = self.changed
+        return changed[index] if index in changed else self.base[index]
+
+    def __setitem__(self, index, value):
+        self.changed[index] = value
+
+    def __len__(self):
+        return len(self.base)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self.base)))
+
+
+class WeightedSampler:
+    """
+    Questions bucketed by type, drawn by weight without replacement.
+
+    questions : any Question-like objects (with _type)
+    weights : one weight per question, all 1 (a plain random draw) if not
+        given
+    """
+
+    def __init__(self, questions, weights=None, rng=random):
+        self.rng = rng
+        if weights is None:
+            weights = [1.0] * len(questions)
+        grouped = {}
+        for question, weight in zip(questions, weights):
+            grouped.setdefault(question._type, ([], []))
+            grouped[question._type][0].append(question)
+            grouped[question._type][1].append(weight)
+        self.buckets = {_type: (members, FenwickTree(bucket_weights))
+                        for _type, (members, bucket_weights) in grouped.items()}
+        self.remaining = {_type: sum(1 for weight in bucket_weights if weight > 0)
+                          for _type, (members, bucket_weights) in grouped.items()}
+
+    def __len__(self):
+        return sum(self.remaining.values())
+
+    def view(self, rng=None):
+        """
+        Returns a copy-on-write copy of this sampler: it starts with the same
+        questions, but what it draws isn't taken out of this one.
+        """
+        copy = WeightedSampler.__new__(WeightedSampler)
+        copy.rng = rng or self.rng
+        copy.buckets = {_type: (members, FenwickOverlay(tree)) for _type, (members, tree) in self.buckets.items()}
+        copy.remaining = dict(self.remaining)
+        return copy
+
+    def commit(self, view):
+        """
+        Takes what a view of this sampler (see view) has drawn out of this
+        one too, i.e. once what was drawn from the view is kept. Nothing may
+        be drawn from this sampler between making the view and committing it.
+        """
+        for _type, (members, tree) in view.buckets.items():
+            assert tree.base is self.buckets[_type][1], "Only a view of this sampler can be committed"
+            tree.commit()
+        self.remaining = dict(view.remaining)
+
+    def count(self, _type):
+        return self.remaining.get(_type, 0)
+
+    def draw(self, _type, pop=True):
+        """
+        Returns a question of the given type, chosen by weight, and takes it
+        out of the sampler unless pop is False. Returns None if there are no
+        questions of that type left.
+        """
+        if not self.count(_type):
+            return None
+        members, tree = self.buckets[_type]
+        while True:
+            index = tree.find(self.rng.random() * tree.total())
+            # Rounding can land past the last question with any weight left
+            if index < tree.size and tree.weights[index] > 0:
+                break
+        if pop:
+            tree.set(index, 0.0)
+            self.remaining[_type] -= 1
+        return members[index]
+
+    def questions(self):
+        """
+        Returns every question not yet drawn.
+        """
+        return [question for members, tree in self.buckets.values()
+                for question, weight in zip(members, tree.weights) if weight > 0]
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Purpose:
+    Answers coaches' questions about the quiz history (see QuizHistory.py):
+        -which questions have never been used?
+        -which questions were used since a date, or between two dates?
+        -which verses haven't been quizzed since January?
+    and lets QuizGen leave recently used questions out of its pools.
+
+    Every (question, quiz, date) the history records is a row of the
+    ledger, with questions and quizzes numbered in the order they are first
+    seen. For every quiz date, the ledger keeps a bitmap (a Python int) with
+    bit n set if question n was asked that day, so "used between two dates"
+    is an OR of the bitmaps of the dates in between, and filtering a pool is
+    one bit test per question. Uses of unknown date (see QuizHistory.py) have
+    a bitmap of their own, only counted when no dates are given.
+
+    The ledger isn't saved: it is built from the saved history each run,
+    which takes about as long as reading it back would.
+
+Usage:
+    python UsageLedger.py --never-used --library <question .csv> --book Hebrews
+    python UsageLedger.py --verses-not-since 2024-01-01 --books Hebrews
+"""
+# Imports ====================================================================
+import argparse
+import bisect
+import os
+import sys
+from array import array
+from datetime import date, datetime
+
+absolute_path = os.path.dirname(__file__)
+sys.path.append(os.path.join(absolute_path, "../Common"))
+
+import Corpus  # noqa: E402
+import QuizHistory  # noqa: E402
+
+
+# Function definitions =======================================================
+def day_number(when):
+    """
+    Returns the proleptic ordinal of a date, datetime, or ISO string.
+    """
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when)
+    if isinstance(when, datetime):
+        when = when.date()
+    return when.toordinal()
+
+
+# Class definitions ==========================================================
+class UsageLedger:
+    """
+    Rows of (question number, quiz number, day), and a bitmap of the
+    questions asked on each day.
+    """
+
+    def __init__(self):
+        self.question_ids = []
+        self.question_numbers = {}
+        self.question_verses = []
+        self.quiz_ids = []
+        self.quiz_numbers = {}
+        self.questions = array('i')
+        self.quizzes = array('i')
+        self.days = array('i')
+        self.day_bitmaps = {}
+        self.undated = 0  # bitmap of the questions used on unknown dates
+        self._sorted_days = None
+
+    def __len__(self):
+        return len(self.questions)
+
+    def number(self, question_id, add=False):
+        """
+        Returns a question's number, or None if it's not in the ledger (it
+        is added if add is True).
+        """
+        number = self.question_numbers.get(question_id)
+        if number is None and add:
+            number = self.question_numbers[question_id] = len(self.question_ids)
+            self.question_ids.append(question_id)
+            self.question_verses.append(())
+        return number
+
+    def numbers_of(self, questions):
+        """
+        Returns the number of each question (anything with question_id()),
+        or -1 for questions not in the ledger.
+        """
+        numbers = self.question_numbers
+        return [numbers.get(question.question_id(), -1) for question in questions]
+
+    def record(self, question_id, quiz_id, when, vids=()):
+        """
+        Adds one use of a question. when is None if the date isn't known.
+        """
+        number = self.number(question_id, add=True)
+        if vids:
+            self.question_verses[number] = tuple(vids)
+        quiz = self.quiz_numbers.get(quiz_id)
+        if quiz is None:
+            quiz = self.quiz_numbers[quiz_id] = len(self.quiz_ids)
+            self.quiz_ids.append(quiz_id)
+        day = 0 if when is None else day_number(when)
+        self.questions.append(number)
+        self.quizzes.append(quiz)
+        self.days.append(day)
+        if not day:
+            self.undated |= 1 << number
+            return
+        if day not in self.day_bitmaps:
+            self._sorted_days = None
+        self.day_bitmaps[day] = self.day_bitmaps.get(day, 0) | (1 << number)
+
+    @classmethod
+    def from_history(cls, history):
+        """
+        Builds a ledger from a QuizHistory.UsageHistory, oldest quiz first.
+        """
+        ledger = cls()
+        for path, source in sorted(history.sources.items(), key=lambda item: item[1]["date"] or ""):
+            verses = source.get("verses", {})
+            for quiz_title, ids in source["quizzes"].items():
+                quiz_id = f"{os.path.basename(path)}#{quiz_title}"
+                for qid in ids:
+                    ledger.record(qid, quiz_id, source["date"], verses.get(qid, ()))
+        return ledger
+
+    def used_between(self, start=None, end=None):
+        """
+        Returns the bitmap of questions used from start to end (dates,
+        datetimes or ISO strings, both included). Either can be left open.
+        Uses of unknown date are only counted if both are.
+        """
+        if self._sorted_days is None:
+            self._sorted_days = sorted(self.day_bitmaps)
+        days = self._sorted_days
+        first = 0 if start is None else bisect.bisect_left(days, day_number(start))
+        last = len(days) if end is None else bisect.bisect_right(days, day_number(end))
+        bitmap = self.undated if start is None and end is None else 0
+        for day in days[first:last]:
+            bitmap |= self.day_bitmaps[day]
+        return bitmap
+
+    def used_since(self, start):
+        return self.used_between(start, None)
+
+    def bitmap_of(self, question_ids):
+        """
+        Returns the bitmap of a list of question ids (ids never used are
+        left out).
+        """
+        bitmap = 0
+        for qid in question_ids:
+            number = self.question_numbers.get(qid)
+            if number is not None:
+                bitmap |= 1 << number
+        return bitmap
+
+    def ids_of(self, bitmap):
+        """
+        Returns the question ids whose bits are set in a bitmap.
+        """
+        found = []
+        # A byte at a time, as shifting the whole int for each bit is quadratic
+        bits = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        for start, byte in enumerate(bits):
+            while byte:
+                lowest = byte & -byte
+                found.append(self.question_ids[(start << 3) + lowest.bit_length() - 1])
+                byte ^= lowest
+        return found
+
+    def is_used(self, question_id, bitmap):
+        number = self.question_numbers.get(question_id)
+        return number is not None and bool(bitmap >> number & 1)
+
+    def exclude(self, questions, bitmap):
+        """
+        Returns the questions (anything with question_id()) whose bits
+        aren't set in the bitmap, i.e. exclude(pool, ledger.used_since(date)).
+        """
+        # Bytes, so each test is an index rather than a shift of the whole int
+        bits = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        size = len(bits) * 8
+        return [question for question, number in zip(questions, self.numbers_of(questions))
+                if not 0 <= number < size or not bits[number >> 3] >> (number & 7) & 1]
+
+    def never_used(self, question_ids):
+        """
+        Returns the question ids that aren't in the ledger at all.
+        """
+        return [qid for qid in question_ids if qid not in self.question_numbers]
+
+    def verses_used(self, bitmap):
+        """
+        Returns the set of verse ids covered by the questions in a bitmap.
+        """
+        verses = set()
+        for qid in self.ids_of(bitmap):
+            verses.update(self.question_verses[self.question_numbers[qid]])
+        return verses
+
+    def uses(self, question_id):
+        """
+        Returns [(quiz id, date)] of every use of a question, with a date of
+        None if it isn't known.
+        """
+        number = self.question_numbers.get(question_id)
+        return [(self.quiz_ids[self.quizzes[row]],
+                 date.fromordinal(self.days[row]).isoformat() if self.days[row] else None)
+                for row in range(len(self)) if self.questions[row] == number]
+
+
+def load_ledger(paths=None):
+    """
+    Returns a UsageLedger of the quiz history, updated from the quiz files.
+    """
+    return UsageLedger.from_history(QuizHistory.load_history(paths))
+
+
+# Main =======================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="UsageLedger",
+                                     description="Answers questions about which questions and verses have been used.")
+    parser.add_argument("--since", help="Only count uses on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Only count uses on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--never-used", action="store_true",
+                        help="List the questions of --library that have never been used (in the dates given)")
+    parser.add_argument("--library", help="Question .csv for --never-used")
+    parser.add_argument("--book", help="Book to use if the library has no Book column")
+    parser.add_argument("--verses-not-since", metavar="DATE",
+                        help="List the verses of --books not quizzed since DATE (YYYY-MM-DD)")
+    parser.add_argument("--books", help="Comma-separated books for --verses-not-since")
+    options = parser.parse_args()
+
+    ledger = load_ledger()
+    used = ledger.used_between(options.since, options.until)
+    print(f"{len(ledger)} uses of {len(ledger.question_ids)} questions in {len(ledger.quiz_ids)} quizzes, "
+          f"{bin(used).count('1')} questions used in the dates given.")
+
+    if options.never_used:
+        assert options.library, "--never-used needs a --library"
+        import QuestionStore
+        store = QuestionStore.QuestionStore.from_csv(options.library, options.book)
+        unused = ledger.exclude(list(store), used)
+        for question in unused:
+            print(f"    {question.reference()} {question._type}: {question.prompt}")
+        print(f"{len(unused)} of {len(store)} questions not used.")
+
+    if options.verses_not_since:
+        assert options.books, "--verses-not-since needs --books"
+        quizzed = ledger.verses_used(ledger.used_since(options.verses_not_since))
+        with Corpus.load_corpus() as corpus:
+            verses = [vid for book in options.books.split(',') for vid in corpus.verse_ids(book.strip())]
+        missing = [vid for vid in verses if vid not in quizzed]
+        for vid in missing:
+            print(f"    {Corpus.verse_id_to_string(vid)}")
+        print(f"{len(missing)} of {len(verses)} verses not quizzed since {options.verses_not_since}.")
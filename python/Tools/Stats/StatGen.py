@@ -19,8 +19,11 @@ Data to be processed should be placed in the head/data/ directory
 # Imports ====================================================================
 
 import os
+import sys
 import xml.etree.ElementTree as ET
-import yaml
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../Common"))
+import Startup  # noqa: E402
 
 # Constants ==================================================================
 match_points_map = {
@@ -112,8 +115,19 @@ config_path = os.path.join(absolute_path, "../../../configs/")
 results_path = os.path.join(absolute_path, "../../../results/")
 statgen_map_path = os.path.join(config_path, "statgen_map.yml")
 
-with open(statgen_map_path, 'r') as file:
-    id_map = yaml.safe_load(file)
+
+def validate_id_map(id_map):
+    """
+    Checks statgen_map.yml, and makes every team and player id a number, as
+    they are looked up (an id written in quotes would otherwise never match).
+    """
+    assert isinstance(id_map, dict) and id_map.get("Filename"), "statgen_map.yml needs a Filename"
+    for section in ("Teams", "Players"):
+        id_map[section] = {int(key): value for key, value in (id_map.get(section) or {}).items()}
+    return id_map
+
+
+id_map = Startup.load_config(statgen_map_path, validate_id_map)
 
 data_path = os.path.join(absolute_path, "../../../data/")
 xml_path = os.path.join(data_path, id_map["Filename"])
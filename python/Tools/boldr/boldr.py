@@ -19,163 +19,329 @@ Changelog:
 
 # IMPORTS ====================================================================
 import argparse
+import bisect
+import functools
 import os
 import re
 import sys
-import yaml
+
+from html_emitter import HtmlEmitter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../Common"))
+import Corpus  # noqa: E402
+import Startup  # noqa: E402
 
 
 # CONSTANTS ==================================================================
 chapterPath = './Hebrews/Hebrews.txt'
 alphaChars = ['a','b','c','d','e','f','g','h','i','j','k','l','m','n','o','p','q','r','s','t','u','v','w','x','y','z','-',"'"] # characters that make up legal words
+bookPathsPath = os.path.join(os.path.dirname(__file__), "./BookPaths.yml")
+hashBase = 1000003  # rolling hash of phrases, base and (Mersenne prime) modulus
+hashModulus = (1 << 61) - 1
+maxPhraseLength = 5
 
-# FUNCTIONS ==================================================================
-def main(arg_material, arg_result_path, arg_title):
-    
-    
-    
-    
-    def parse_yaml():
+# CLASSES ====================================================================
+class MaterialLibrary:
+    """
+        The book catalog from BookPaths.yml, loaded once.
+
+        Every chapter path is resolved and checked when the library is made,
+        and chapter texts are cached (up to cache_size chapters), so the same
+        library can be handed to main() over and over in one process, i.e.
+        to generate one .html per book in a loop.
+    """
+
+    def __init__(self, catalog_path=bookPathsPath, cache_size=128):
         """
-            Reads the BookPaths.yml and returns a dictionary of books with their
-            associated path and chapter list.
-            
-            Returns: material - a dict of "book"
+            Accepts: catalog_path - location of the BookPaths.yml to load
+                    cache_size - the most chapter texts to keep in memory
+
+            Throws an error if any chapter file in the catalog can't be found.
         """
-        
-        absolute_path = os.path.dirname(__file__)
-        paths_yaml_path = os.path.join(absolute_path, "./BookPaths.yml")
-    
-        with open(paths_yaml_path, 'r') as file:
-            material = yaml.safe_load(file)
-        
-        return material
-        
-    
-    def parse_books(specified_material):
+        catalog = Startup.load_config(catalog_path, validate_catalog)
+
+        catalog_dir = os.path.dirname(os.path.abspath(catalog_path))
+        self.catalog = catalog
+        self.paths = {}
+        for book, entry in catalog.items():
+            book_dir = os.path.normpath(os.path.join(catalog_dir, entry["Path"]))
+            for chapter in entry["Chapters"]:
+                chapter_path = os.path.join(book_dir, f"{chapter}.chapter")
+                if not os.path.isfile(chapter_path):
+                    raise FileNotFoundError(f"{book} chapter {chapter} not found at {chapter_path}")
+                self.paths[(book, chapter)] = chapter_path
+
+        self.chapter_text = functools.lru_cache(maxsize=cache_size)(self._read_chapter)
+
+    def _read_chapter(self, book, chapter):
+        with open(self.paths[(book, chapter)], 'r', encoding="utf8") as file:
+            return file.read()
+
+    def books(self):
+        """
+            Returns: a list of every book in the catalog, in catalog order
+        """
+        return list(self.catalog.keys())
+
+    def chapters(self, book):
+        """
+            Returns: the list of chapters of a book
+        """
+        return self.catalog[book]["Chapters"]
+
+    def parse_books(self, specified_material):
         """
             Accepts: specified_material - a string of comma-seperated books used to
             specify the scope of texts that this script considers when finding unique words.
             (i.e. what the user enters as command line arguments)
-            
+
             Returns: book_list - a list of individually checked books, in string form
-            
-            Throws an error if a book can't be found in the YAML lookup.    
+
+            Throws an error if a book can't be found in the catalog.
         """
         final_book_list = []
-        ok_books = parse_yaml().keys()
-        
+
         # Remove spaces, split by commas
-        specified_material = specified_material.translate({' ':''})
+        specified_material = specified_material.replace(' ', '')
         book_list = specified_material.split(',')
-        
+
         for book in book_list:
-            if book in ok_books:
+            if book in self.catalog:
                 final_book_list.append(book)
             else:
                 raise IndexError(f"Book {book} not found in material library.")
-        
+
         return final_book_list
+
+
+# FUNCTIONS ==================================================================
+def main(arg_material, arg_result_path, arg_title, library=None, scopes="material", phrases=""):
+    """
+        Accepts: arg_material, arg_result_path, arg_title - see the command line arguments
+                scopes - comma-separated scopes of uniqueness to mark. "material"
+                bolds words unique in all of the material, "book" marks words
+                unique within their own book. Both are found in the same pass.
+                phrases - comma-separated phrase lengths (2 to 5 words) to
+                highlight when the phrase occurs exactly once, i.e. "2,3".
+                Empty to only mark words.
+                library - a MaterialLibrary to reuse between calls. A new one
+                is loaded if not given.
+    """
     
-    
-    def bold_word(word):
+    def split_and_count_words(chapters):
         """
-            Accepts: word - a string to be bolded with html tags
-            Returns: tagged - same word surrounded by html bold tags
+            Accepts: chapters - a list of (book number, chapter number, chapter
+                    text) for every chapter of the material
+            
+            Returns: words_in_chapters - a list with one list per chapter of
+                    (start, end, lowercase word) for every word, in order
+                    occurences_dict - a lowercase dictionary of every word
+                    that appears in the material, with values matching the number of occurences
+                    book_occurences - a dict with one occurences_dict per book number
+                    verses_in_chapters - a list with one list per chapter of
+                    (first word, end word) of each verse, so phrases can be
+                    kept from running from one verse into the next
         """
-        tagged = f"<b>{word}</b>"
-        return tagged
+        
+        word = re.compile(r"\b[a-z\-]+\b", flags=re.IGNORECASE)
+        words_in_chapters = []
+        occurences_dict = {}
+        book_occurences = {}
+        verses_in_chapters = []
+        
+        # One pass over the text fills in the combined and per-book counts
+        for book_number, chapter, text in chapters:
+            book_counts = book_occurences.setdefault(book_number, {})
+            words_in_chapter = []
+            for occurence in word.finditer(text):
+                lower = occurence.group().lower()
+                words_in_chapter.append((occurence.start(), occurence.end(), lower))
+                occurences_dict[lower] = occurences_dict.get(lower, 0) + 1
+                book_counts[lower] = book_counts.get(lower, 0) + 1
+            words_in_chapters.append(words_in_chapter)
+            
+            # The words dropped the verse numbers, so find where each verse starts
+            word_starts = [start for start, end, lower in words_in_chapter]
+            breaks = {bisect.bisect_left(word_starts, start)
+                      for start, end, chap, verse in Corpus.verse_markers(text, chapter)}
+            edges = sorted(breaks | {0, len(words_in_chapter)})
+            verses_in_chapters.append([(first, end) for first, end in zip(edges, edges[1:]) if first < end])
+        
+        return words_in_chapters, occurences_dict, book_occurences, verses_in_chapters
     
     
-    def header_word(word, level=3):
+    def hash_phrases(words_in_chapters, verses_in_chapters, word_ids, book_numbers, max_length):
         """
-            Accepts: word - a string to be made a header with html tags
-                    level - an int of the header level desired, 1-6
-            Returns: tagged - same string surrounded by html header tags
+            Rolling hashes of every phrase of 2 to max_length words, in one pass
+            over the words of each chapter. Phrases don't cross verses: the
+            window starts again at each verse.
+
+            Accepts: words_in_chapters, verses_in_chapters - from split_and_count_words
+                    word_ids - a dict of lowercase word to a number
+                    book_numbers - the book number of each chapter
+                    max_length - the longest phrase to hash
+
+            Returns: prefix_hashes - a list per chapter of prefix hashes, so
+                    the hash of words i to j is found with phrase_hash
+                    phrase_counts - {(length, hash): occurences} for all of the material
+                    book_phrase_counts - a dict of one phrase_counts per book number
         """
-        tagged = f"<h{level}>{word}</h{level}>"
-        return tagged
+        powers = [1]
+        for length in range(max_length):
+            powers.append(powers[-1] * hashBase % hashModulus)
+        
+        prefix_hashes = []
+        phrase_counts = {}
+        book_phrase_counts = {}
+        for words_in_chapter, verses, book_number in zip(words_in_chapters, verses_in_chapters, book_numbers):
+            prefixes = [0]
+            for start, end, lower in words_in_chapter:
+                prefixes.append((prefixes[-1] * hashBase + word_ids[lower]) % hashModulus)
+            prefix_hashes.append(prefixes)
+            
+            book_counts = book_phrase_counts.setdefault(book_number, {})
+            for length in range(2, max_length + 1):
+                power = powers[length]
+                for verse_first, verse_end in verses:
+                    for first in range(verse_first, verse_end - length + 1):
+                        key = (length, (prefixes[first + length] - prefixes[first] * power) % hashModulus)
+                        phrase_counts[key] = phrase_counts.get(key, 0) + 1
+                        book_counts[key] = book_counts.get(key, 0) + 1
+        
+        return prefix_hashes, phrase_counts, book_phrase_counts
     
     
-    def split_and_count_words(book):
+    def unique_phrases(words_in_chapter, verses, prefixes, phrase_counts, word_counts, lengths):
         """
-            Accepts: book - "A long string of text"
-            
-            Returns: occurences_dict - a lowercase dictionary of every word
-            that appears in the book, with values matching the number of occurences
+            Finds the unique phrases of a chapter, within its verses. Only the
+            shortest unique phrases are marked: a phrase counts if it occurs
+            once but the phrases one word shorter at either end of it don't
+            (which also leaves out every phrase with a unique word in it).
+
+            Accepts: words_in_chapter, verses, prefixes - one chapter's words,
+                    verses and prefix hashes
+                    phrase_counts - the phrase counts of the scope to use
+                    word_counts - the word counts of the same scope
+                    lengths - the phrase lengths to mark
+
+            Returns: a list of (first word, end word) of each phrase, in
+                    order, with overlapping phrases joined into one
         """
+        found = []
+        powers = {}
         
-        word = re.compile(r"\b[a-z\-]+\b", flags=re.IGNORECASE)
-        words_in_book = re.findall(word, book)
-        occurences_dict = {}
+        def count(first, length):
+            if length == 1:
+                return word_counts[words_in_chapter[first][2]]
+            if length not in powers:
+                powers[length] = pow(hashBase, length, hashModulus)
+            key = (length, (prefixes[first + length] - prefixes[first] * powers[length]) % hashModulus)
+            return phrase_counts[key]
         
-        for occurence in words_in_book:
-            if occurence.lower() not in occurences_dict.keys():
-                occurences_dict[occurence.lower()] = 1
-            else:
-                occurences_dict[occurence.lower()] = occurences_dict[occurence.lower()] + 1
+        for length in lengths:
+            for verse_first, verse_end in verses:
+                for first in range(verse_first, verse_end - length + 1):
+                    if (count(first, length) == 1 and count(first, length - 1) > 1
+                            and count(first + 1, length - 1) > 1):
+                        found.append((first, first + length))
         
-        return occurences_dict
+        phrases = []
+        for first, end in sorted(found):
+            if phrases and first < phrases[-1][1]:
+                phrases[-1][1] = max(phrases[-1][1], end)
+            else:
+                phrases.append([first, end])
+        return [tuple(phrase) for phrase in phrases]
     
     
-    def bold_every_unique_word(book, occurences_dict):
+    def unique_word_spans(words_in_chapter, occurences_dict, book_counts, scopes, phrases=()):
         """
-            Accepts: book - "A long string of text"
-                    occurences_dict - a lowercase dictionary of every word
-                    that appears in the book, with values matching the number
-                    of occurences
+            Accepts: words_in_chapter - one chapter's list from split_and_count_words
+                    occurences_dict - the counts for all of the material
+                    book_counts - the counts for the chapter's book
+                    scopes - which uniqueness to mark, any of "material"
+                    and "book"
+                    phrases - from unique_phrases, if phrases are marked
             
-            Returns: bolded_book - A copy of the original book that has every
-                    unique word bolded with html bold tags
+            Yields: (start, end, tags) for every unique word in the chapter.
+                    Words unique in all of the material are bold, words only
+                    unique within their book are underlined (or bold, if
+                    that's the only scope). Each unique phrase is one
+                    highlighted span, yielded before the words inside it.
         """
-        bolded_book = book
-        #print(bolded_book)
-        # print(occurences_dict)
-        
-        for occurence in occurences_dict.keys():
-            if occurences_dict[occurence] == 1:
-                word = re.compile(rf"(\b{occurence}\b)(?![\w-])", flags=re.IGNORECASE)
-                #print(word)
-                temp_book = re.split(word, bolded_book, maxsplit=1)
-                #print(temp_book)
-                bolded_book = temp_book[0] + bold_word(temp_book[1]) + temp_book[2]
-        
-        return bolded_book
+        book_tag = "u" if "material" in scopes else "b"
+        phrase_starts = {first: end for first, end in phrases}
+        for index, (start, end, lower) in enumerate(words_in_chapter):
+            if index in phrase_starts:
+                yield start, words_in_chapter[phrase_starts[index] - 1][1], ("mark",)
+            tags = ()
+            if "material" in scopes and occurences_dict[lower] == 1:
+                tags += ("b",)
+            elif "book" in scopes and book_counts[lower] == 1:
+                tags += (book_tag,)
+            if tags:
+                yield start, end, tags
     
     
     # CODE =======================================================================
     # Section 1: Prep ----------------
-    book_list = parse_books(arg_material)
-    # By the end of this section, need to have the material in one giant string
-    material_lookup = parse_yaml()
-    material_string = ""
-    
-    for book in book_list:
-        material_string = material_string + header_word(book, 2) + '\n'
-        for chapter in material_lookup[book]['Chapters']:
-            
-            filename = f"{chapter}.chapter"
-            absolute_path = os.path.dirname(__file__)
-            book_path = os.path.join(os.path.join(absolute_path, material_lookup[book]["Path"]), filename)
-            
-            with open(book_path, 'r', encoding="utf8") as file:
-                material_string = material_string + header_word(f"Chapter {chapter}", 3) + '\n'
-                material_string = material_string + file.read()
+    if library is None:
+        library = MaterialLibrary()
+    scopes = [scope.strip() for scope in scopes.split(',')]
+    for scope in scopes:
+        if scope not in ("material", "book"):
+            raise ValueError(f"Scope {scope} not recognized, use material and/or book.")
+    phrase_lengths = sorted({int(length) for length in str(phrases or "").split(',') if length.strip()})
+    for length in phrase_lengths:
+        if not 2 <= length <= maxPhraseLength:
+            raise ValueError(f"Phrase length {length} not supported, use 2 to {maxPhraseLength}.")
+    book_list = library.parse_books(arg_material)
+    # By the end of this section, need every chapter of the material in order
+    chapters = []
+    
+    for book_number, book in enumerate(book_list):
+        for chapter in library.chapters(book):
+            chapters.append((book_number, chapter, library.chapter_text(book, chapter)))
     
-    #print(material_string)
     # Section 2: Process -------------
-    occurences_dict = split_and_count_words(material_string)
-    bolded_string = bold_every_unique_word(material_string, occurences_dict)
+    words_in_chapters, occurences_dict, book_occurences, verses_in_chapters = split_and_count_words(chapters)
+    if phrase_lengths:
+        word_ids = {word: number for number, word in enumerate(occurences_dict, start=1)}
+        prefix_hashes, phrase_counts, book_phrase_counts = hash_phrases(
+            words_in_chapters, verses_in_chapters, word_ids, [book_number for book_number, chapter, text in chapters],
+            max(phrase_lengths))
 
     # Section 3: Generate Output -----
-    bolded_string = bolded_string.translate({'\n': "<br>"})
-    html_string = f"<html><h1>{arg_title}</h1>" + bolded_string + "</html>"
-    
+    # Bolding happens as the html is written, chapter by chapter
     absolute_path = os.path.dirname(__file__)
-    final_write_path = os.path.join(absolute_path, f"./{arg_result_path}/{arg_title}.html")
+    final_write_path = os.path.join(absolute_path, arg_result_path, f"{arg_title}.html")
     
-    with open(final_write_path, 'x') as file:
-        file.write(html_string)
+    with open(final_write_path, 'x', encoding="utf8") as file, HtmlEmitter(file, arg_title) as html:
+        if "material" in scopes and "book" in scopes:
+            html.write("<p><b>Bold</b>: unique in all of the material. "
+                       "<u>Underlined</u>: unique within its own book.</p>\n")
+        if phrase_lengths:
+            html.write("<p><mark>Highlighted</mark>: phrases of "
+                       + ", ".join(str(length) for length in phrase_lengths)
+                       + " words that only occur once.</p>\n")
+        index = 0
+        for book_number, book in enumerate(book_list):
+            html.header(book, 2)
+            for chapter in library.chapters(book):
+                html.header(f"Chapter {chapter}", 3)
+                phrases = ()
+                if phrase_lengths:
+                    # Phrases use the widest scope chosen
+                    if "material" in scopes:
+                        counts, word_counts = phrase_counts, occurences_dict
+                    else:
+                        counts, word_counts = book_phrase_counts[book_number], book_occurences[book_number]
+                    phrases = unique_phrases(words_in_chapters[index], verses_in_chapters[index],
+                                             prefix_hashes[index], counts, word_counts, phrase_lengths)
+                spans = unique_word_spans(words_in_chapters[index], occurences_dict,
+                                          book_occurences[book_number], scopes, phrases)
+                html.tagged_text(chapters[index][2], spans)
+                index += 1
     
 
 def parse_config():
@@ -188,12 +354,32 @@ def parse_config():
     absolute_path = os.path.dirname(__file__)
     paths_yaml_path = os.path.join(absolute_path, "./BoldrConfig.yml")
 
-    with open(paths_yaml_path, 'r') as file:
-        arg_paths = yaml.safe_load(file)
-    
+    return Startup.load_config(paths_yaml_path, validate_config)
+
+
+def validate_config(arg_paths):
+    """
+        Checks BoldrConfig.yml, run when it changes (see Startup.load_config)
+    """
+    assert isinstance(arg_paths, dict), "BoldrConfig.yml should be a list of argument: default"
+    for key in ("material", "result_path", "title"):
+        assert key in arg_paths, f"BoldrConfig.yml needs {key}"
+    arg_paths.setdefault("scopes", "material")
+    arg_paths["phrases"] = arg_paths.get("phrases") or ""
     return arg_paths
 
 
+def validate_catalog(catalog):
+    """
+        Checks BookPaths.yml, and makes every chapter a number
+    """
+    assert isinstance(catalog, dict), "BookPaths.yml should list books"
+    for book, entry in catalog.items():
+        assert "Path" in entry and "Chapters" in entry, f"{book} needs a Path and Chapters"
+        entry["Chapters"] = [int(chapter) for chapter in entry["Chapters"]]
+    return catalog
+
+
 if __name__ == "__main__":
    
     default_args = parse_config()
@@ -209,6 +395,10 @@ if __name__ == "__main__":
                         help="Relative or absolute location to place results file")
     parser.add_argument("--title",
                         help="Title of .html file")
+    parser.add_argument("--scopes",
+                        help="Comma-separated scopes of uniqueness: material, book, or both")
+    parser.add_argument("--phrases",
+                        help="Comma-separated phrase lengths (2-5) to highlight when unique, i.e. 2,3")
     options = parser.parse_args()
     
     dict_options = vars(options)
@@ -217,4 +407,5 @@ if __name__ == "__main__":
             print(f"Empty argument {option} identified, using default.")
             dict_options[option] = default_args[option]
             
-    main(dict_options["material"], dict_options["result_path"], dict_options["title"])
\ No newline at end of file
+    main(dict_options["material"], dict_options["result_path"], dict_options["title"],
+         scopes=dict_options["scopes"], phrases=dict_options["phrases"])
\ No newline at end of file
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming .html writer for boldr.
+
+Text is escaped, its newlines turned into paragraphs and line breaks, and
+the bold/underline tags are inserted all in the same pass, and the output is
+written to the file in large chunks instead of being built up as one string.
+
+"""
+
+# IMPORTS ====================================================================
+import re
+
+
+# CONSTANTS ==================================================================
+chunkSize = 1 << 16  # characters to collect before each write
+
+# Blank lines end a paragraph, single newlines are line breaks (keeping the
+# indent of poetry lines), and anything else is a character to escape.
+layoutPattern = re.compile(r"\n[ \t]*\n\s*|\n[ \t]*|[&<>\"]")
+escapes = {'&': "&amp;", '<': "&lt;", '>': "&gt;", '"': "&quot;"}
+
+pageStyle = """<style>
+    body {font-family: serif; max-width: 50em; margin: auto;}
+    u {text-decoration-style: dotted;}
+    mark {background-color: #fff3a8;}
+    </style>"""
+
+
+# FUNCTIONS ==================================================================
+def layout_match(match):
+    """
+        Accepts: match - a match of layoutPattern
+        Returns: the html that replaces it
+    """
+    found = match.group()
+    if found[0] != '\n':
+        return escapes[found]
+    if found.count('\n') > 1:
+        return "</p>\n<p>"
+    return "<br>\n" + "&nbsp;" * (len(found) - 1)
+
+
+def escape_text(text):
+    """
+        Accepts: text - plain text from the material
+        Returns: text escaped for html, with newlines laid out
+    """
+    return layoutPattern.sub(layout_match, text)
+
+
+# CLASSES ====================================================================
+class HtmlEmitter:
+    """
+        Writes an html document to an open file, chunkSize characters at a time.
+
+        Use as a context manager: the head is written on entry, and the rest
+        of the buffer and the closing tags are written on exit.
+    """
+
+    def __init__(self, file, title, chunk_size=chunkSize):
+        self.file = file
+        self.title = title
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+
+    def __enter__(self):
+        self.write(f"<html><head><meta charset=\"utf-8\"><title>{escape_text(self.title)}</title>"
+                   f"{pageStyle}</head><body>\n")
+        self.header(self.title, 1)
+        return self
+
+    def __exit__(self, *args):
+        self.write("</body></html>\n")
+        self.flush()
+
+    def write(self, html):
+        """
+            Accepts: html - a string that is already html
+        """
+        self.buffer.append(html)
+        self.buffered += len(html)
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write("".join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def header(self, text, level=3):
+        """
+            Accepts: text - plain text to be made a header
+                    level - an int of the header level desired, 1-6
+        """
+        self.write(f"<h{level}>{escape_text(text)}</h{level}>\n")
+
+    def paragraph(self, text):
+        """
+            Accepts: text - plain text to write as a paragraph
+        """
+        self.write(f"<p>{escape_text(text)}</p>\n")
+
+    def tagged_text(self, text, spans):
+        """
+            Writes a block of text, tagging some of its words as it goes.
+
+            Accepts: text - "A long string of text"
+                    spans - an iterable of (start, end, tags) in order, i.e.
+                    (6, 11, "b") bolds text[6:11], and (6, 11, ("mark", "b"))
+                    highlights and bolds it. A span may hold the spans after
+                    it, i.e. (0, 11, "mark") then (6, 11, "b") highlights a
+                    phrase with a bold word in it. Spans may be produced
+                    lazily, they are consumed as the text is written.
+        """
+        write = self.write
+        write("<p>")
+        last_end = 0
+        open_spans = []  # (end, opening tags, closing tags) of the spans holding this one
+
+        def escape_within(piece):
+            # A span running over a paragraph break is closed before it and
+            # opened again after it, so the tags stay inside the paragraphs
+            html = escape_text(piece)
+            if open_spans and "</p>" in html:
+                opening = "".join(tags for _, tags, _ in open_spans)
+                closing = "".join(tags for _, _, tags in reversed(open_spans))
+                html = html.replace("</p>\n<p>", closing + "</p>\n<p>" + opening)
+            return html
+
+        def close(until):
+            nonlocal last_end
+            while open_spans and open_spans[-1][0] <= until:
+                end, _, closing = open_spans[-1]
+                write(escape_within(text[last_end:end]) + closing)
+                open_spans.pop()
+                last_end = end
+
+        for start, end, tags in spans:
+            if isinstance(tags, str):
+                tags = (tags,)
+            close(start)
+            write(escape_within(text[last_end:start]))
+            last_end = start
+            open_spans.append((end, "".join(f"<{tag}>" for tag in tags),
+                               "".join(f"</{tag}>" for tag in reversed(tags))))
+            write(open_spans[-1][1])
+        close(len(text))
+        write(escape_text(text[last_end:].rstrip()))
+        write("</p>\n")